@@ -0,0 +1,6 @@
+from .generator import TREES, generate_tree
+from .runner import run_benchmark
+from .checks import run_checks
+
+
+__all__ = ["TREES", "generate_tree", "run_benchmark", "run_checks"]
@@ -0,0 +1,44 @@
+import sys
+import json
+import argparse
+
+from benchmarks import TREES, run_benchmark, run_checks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Замер фаз сканера на синтетических деревьях. Отчёт выводится в JSON.'
+    )
+    parser.add_argument('--trees', default=','.join(TREES), help=f'Деревья через запятую: {", ".join(TREES)}')
+    parser.add_argument('--scale', type=float, default=1.0, help='Множитель размера деревьев')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backend', default='Threads', choices=['Threads', 'Processes', 'Inode order'])
+    parser.add_argument('--threads', type=int, default=None, help='Количество потоков SizeFinder')
+    parser.add_argument('--repeat', type=int, default=1, help='Количество прогонов на дерево')
+    parser.add_argument('--workdir', default=None, help='Где хранить сгенерированные деревья')
+    parser.add_argument('--output', default=None, help='Файл для отчёта (по умолчанию stdout)')
+    parser.add_argument('--verify', action='store_true', help='Вместо замеров проверить сканер на деревьях (код возврата 1 при ошибке)')
+    args = parser.parse_args()
+
+    trees = [name.strip() for name in args.trees.split(',') if name.strip()]
+    unknown = [name for name in trees if name not in TREES]
+    if unknown:
+        parser.error(f'Неизвестные деревья: {", ".join(unknown)}')
+
+    if args.verify:
+        report = run_checks(trees, args.scale, args.seed, args.backend, args.threads, args.workdir)
+    else:
+        report = run_benchmark(trees, args.scale, args.seed, args.backend, args.threads, args.repeat, args.workdir)
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + '\n')
+    if args.verify and not report['passed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+import os
+import gc
+import pickle
+import tempfile
+import multiprocessing
+import compression.zstd
+from queue import Queue
+from datetime import datetime
+from collections import Counter
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Iterator, Optional
+
+from benchmarks.generator import generate_tree
+
+
+# Сколько расхождений попадает в отчёт
+MAX_MISMATCHES = 10
+
+
+class _BaselineFinder:
+    '''
+    Сборка записей до перехода на NodeTable: SizeFinder из исходной версии. _aggregate_sizes,
+    _collapse_folders и _form_final_data перенесены без изменений; обход идёт одним потоком,
+    без игнорируемых путей (как и у проверяемого сканирования) и без записи ошибок в лог.
+    Эталон для check_collapse
+    '''
+    def __init__(self, path: str) -> None:
+        self.starting_point = path
+        self.folders: dict[str, dict[str, Any]] = {}
+        self.to_change: dict[str, str] = {}
+        self.current = 0
+        self.is_running = True
+        self.queue: Queue[str] = Queue()
+
+    def _normalize(self, path: str) -> str:
+        """Приводит путь к стандартному виду для данной ОС."""
+        return os.path.normpath(path)
+
+    def _process_directory(self, path: str) -> None:
+        """
+        Сканирует одну директорию, считает файлы и собирает пути к подпапкам.
+        """
+        subfolders: list[str] = []
+        files: dict[str, int] = {}
+        current_folder_files_size = 0
+        
+        # Нормализуем текущий путь, чтобы он совпадал с ключом в self.folders
+        normalized_current_path = self._normalize(path)
+
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if not self.is_running:
+                        return
+                    try:
+                        # Обработка директорий
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.is_symlink() or os.path.ismount(entry.path):
+                                continue
+
+                            # Важно: нормализуем путь подпапки перед добавлением
+                            child_path = self._normalize(entry.path)
+                            subfolders.append(child_path)
+                            self.queue.put(child_path)
+
+                        # Обработка файлов
+                        elif entry.is_file(follow_symlinks=False):
+                            # st_size дает реальный размер в байтах
+                            file_size = entry.stat(follow_symlinks=False).st_size
+                            current_folder_files_size += file_size
+                            files[entry.name] = file_size
+                    
+                    except PermissionError:
+                        continue
+
+        except PermissionError:
+            pass
+
+        self.current += current_folder_files_size
+
+        if len(files) == 0 and len(subfolders) == 1:
+            self.to_change[normalized_current_path] = subfolders[0]
+        self.folders[normalized_current_path] = {
+            "__files_size__": current_folder_files_size,
+            "used_size": current_folder_files_size,
+            "subfolders": subfolders,
+            "files": files
+        }
+
+    def _aggregate_sizes(self) -> None:
+        """
+        Считает полные размеры папок снизу вверх.
+        """
+        # Сортируем пути по длине строки (от длинных к коротким).
+        # Самые длинные пути — это самые глубокие папки.
+        # Мы гарантированно обработаем детей до их родителей.
+        sorted_paths = sorted(
+            self.folders.keys(), 
+            key=len, 
+            reverse=True
+        )
+
+        for path in sorted_paths:
+            if path == '__root__':
+                continue
+            folder_data = self.folders[path]
+            
+            total_size = folder_data["__files_size__"]
+            
+            for subpath in folder_data["subfolders"]:
+                # Ищем подпапку в уже обработанных данных
+                if subpath in self.folders:
+                    total_size += self.folders[subpath]["used_size"]
+                else:
+                    # Если подпапки нет в ключах (например, ошибка доступа при сканировании),
+                    # мы просто игнорируем её размер, так как он равен 0 или неизвестен.
+                    pass
+
+            folder_data["used_size"] = total_size
+            
+            # Удаляем временное поле, чтобы не засорять JSON
+            del folder_data["__files_size__"]
+
+    def _collapse_folders(self) -> None:
+        '''
+        Объединяет папки, которые содержат только 1 подпапку
+        И удаляет из данных пустые папки (папки, весящие 0 байт)
+        '''
+        to_change = set(sorted(self.to_change))
+        to_remove: set[str] = set()
+        for path in self.folders:
+            if path == '__root__':
+                continue
+            if self.folders[path]["used_size"] == 0:
+                to_remove.add(path)
+            i = 0
+            while i < len(self.folders[path]["subfolders"]):
+                subfolder = self.folders[path]["subfolders"][i]
+                if subfolder in to_change:
+                    self.folders[path]["subfolders"].remove(subfolder)
+                    self.folders[path]["subfolders"].append(self.to_change[subfolder])
+                else:
+                    i += 1
+        for path in to_change | to_remove:
+            if path in self.folders:
+                del self.folders[path]
+        for path in self.folders:
+            if path == '__root__':
+                continue
+            i = 0
+            while i < len(self.folders[path]["subfolders"]):
+                subfolder = self.folders[path]["subfolders"][i]
+                if subfolder in to_remove:
+                    self.folders[path]["subfolders"].remove(subfolder)
+                else:
+                    i += 1
+
+    def _form_final_data(self) -> dict[str, dict[str, Any]]:
+        '''
+        Предобрабатывает данные в формат, который использует визуализатор
+        '''
+        data: dict[str, Any] = {}
+        for path in self.folders.keys():
+            if path == '__root__':
+                continue
+            path = self._normalize(path)
+            data[path] = {
+                'subfolders': [],
+                'files': [],
+                's': self.folders[path]['used_size']
+            }
+            for subfolder in self.folders[path]['subfolders']:
+                data[path]['subfolders'].append({
+                    'p': subfolder,
+                    'n': subfolder[len(path):].lstrip(os.sep) if subfolder.startswith(path) else os.path.basename(subfolder),
+                    's': self.folders[subfolder]['used_size']
+                })
+            for filename, size in self.folders[path]['files'].items():
+                data[path]['files'].append({
+                    'p': os.path.join(path, filename),
+                    'n': filename,
+                    's': size
+                })
+            data[path]['subfolders'].sort(key=lambda x: x['s'], reverse=True) # type: ignore
+            data[path]['files'].sort(key=lambda x: x['s'], reverse=True) # type: ignore
+
+            data[path]['subfolders'] = compression.zstd.compress(pickle.dumps(data[path]['subfolders']))
+            data[path]['files'] = compression.zstd.compress(pickle.dumps(data[path]['files']))
+
+        data['__root__'] = self.folders['__root__']['path']
+        data['__date__'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return data
+
+    def run(self) -> dict[str, dict[str, Any]]:
+        self.folders = {
+            '__root__': {'path': self._normalize(self.starting_point)}
+        }
+        self.queue.put(self._normalize(self.starting_point))
+        while not self.queue.empty():
+            self._process_directory(self.queue.get())
+        self._aggregate_sizes()
+        self._collapse_folders()
+        return self._form_final_data()
+
+
+def _decode_record(record: dict[str, Any]) -> tuple[Any, ...]:
+    '''Сравниваемая часть записи папки: размер и (путь, имя, размер) подпапок и файлов в порядке записи'''
+    return (
+        record['s'],
+        [(item['p'], item['n'], item['s']) for item in pickle.loads(compression.zstd.decompress(record['subfolders']))],
+        [(item['p'], item['n'], item['s']) for item in pickle.loads(compression.zstd.decompress(record['files']))]
+    )
+
+
+def check_collapse(root: str, db_path: str, backend: str, num_threads: Optional[int]) -> dict[str, Any]:
+    '''
+    Сравнивает записи папок, которые пишет SizeFinder.run, с записями исходной реализации (_BaselineFinder)
+    на том же дереве. Единственное намеренное отличие: корень с единственной подпапкой и без файлов
+    исходная реализация сворачивала и теряла его запись, а сейчас запись корня остаётся всегда
+    '''
+    from logic import SizeFinder, Database
+
+    baseline = _BaselineFinder(root)
+    reference = {
+        path: _decode_record(record) for path, record in baseline.run().items()
+        if not path.startswith('__')
+    }
+    root_path = baseline.folders['__root__']['path']
+
+    database = Database(db_path)
+    SizeFinder(database, root, num_threads, backend=backend, ignore_paths=set()).run()
+    database.open()
+    try:
+        current = {path: _decode_record(record) for path, record in database.items() if not path.startswith('__')}
+    finally:
+        database.close()
+
+    exceptions: list[str] = []
+    if root_path in baseline.to_change and root_path not in reference:
+        current.pop(root_path, None)
+        exceptions.append(root_path)
+    mismatches = sorted(
+        path for path in current.keys() | reference.keys()
+        if current.get(path) != reference.get(path)
+    )
+    return {
+        'passed': not mismatches,
+        'records': len(current),
+        'reference_records': len(reference),
+        'root_exceptions': exceptions,
+        'mismatches': mismatches[:MAX_MISMATCHES]
+    }
+
+
+class _CountingEntry:
+    '''Обёртка DirEntry, которая считает вызовы stat (у самого DirEntry атрибуты не подменить)'''
+    __slots__ = ('entry', 'counts')
+
+    def __init__(self, entry: os.DirEntry[str], counts: Counter[str]) -> None:
+        self.entry = entry
+        self.counts = counts
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.entry, name)
+
+    def stat(self, *, follow_symlinks: bool = True) -> os.stat_result:
+        self.counts['entry.stat'] += 1
+        return self.entry.stat(follow_symlinks=follow_symlinks)
+
+
+class _CountingScandir:
+    def __init__(self, path: str, counts: Counter[str]) -> None:
+        counts['scandir'] += 1
+        self.counts = counts
+        self.iterator = _scandir(path)
+
+    def __enter__(self) -> '_CountingScandir':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.iterator.close()
+
+    def __iter__(self) -> Iterator[_CountingEntry]:
+        return (_CountingEntry(entry, self.counts) for entry in self.iterator)
+
+
+_scandir = os.scandir
+
+
+def check_syscalls(root: str, db_path: str, backend: str, num_threads: Optional[int]) -> dict[str, Any]:
+    '''
+    Считает обращения к ФС во время обхода: os.scandir, os.lstat, DirEntry.stat и os.path.normpath.
+    На папку должен приходиться один scandir, на каждую подпапку и каждый файл — один DirEntry.stat,
+    os.lstat — только у корня, а пути не нормализуются заново для каждой папки.
+    Обход идёт одним потоком бэкенда Threads: вызовы в других процессах не посчитать,
+    а счётчики не защищены блокировкой
+    '''
+    from logic import SizeFinder, Database
+
+    counts: Counter[str] = Counter()
+    lstat, normpath = os.lstat, os.path.normpath
+
+    def counting_lstat(*args: Any, **kwargs: Any) -> os.stat_result:
+        counts['lstat'] += 1
+        return lstat(*args, **kwargs)
+
+    def counting_normpath(path: Any) -> Any:
+        counts['normpath'] += 1
+        return normpath(path)
+
+    finder = SizeFinder(Database(db_path), root, 1, ignore_paths=set())
+    finder._prepare() # pyright: ignore[reportPrivateUsage]
+    os.lstat, os.path.normpath = counting_lstat, counting_normpath
+    os.scandir = lambda path: _CountingScandir(path, counts) # type: ignore
+    try:
+        finder._scan() # pyright: ignore[reportPrivateUsage]
+    finally:
+        os.lstat, os.path.normpath, os.scandir = lstat, normpath, _scandir
+        gc.enable()
+
+    directories, files = finder.stats.directories, finder.stats.files
+    expected = {
+        'scandir': directories,
+        'lstat': 1,
+        'entry.stat': directories - 1 + files,
+        # Нормализуется только корень
+        'normpath': 1
+    }
+    actual = {name: counts[name] for name in expected}
+    return {
+        'passed': actual == expected,
+        'directories': directories,
+        'files': files,
+        'expected': expected,
+        'actual': actual
+    }
+
+
+# Проверки: {имя: функция(корень, путь бд, бэкенд, потоков) -> отчёт с полем passed}
+CHECKS: dict[str, Callable[[str, str, str, Optional[int]], dict[str, Any]]] = {
+    'collapse': check_collapse,
+    'syscalls': check_syscalls,
+}
+
+
+def _child(connection: Connection, name: str, *args: Any) -> None:
+    try:
+        connection.send(CHECKS[name](*args))
+    except Exception as e:
+        connection.send({'passed': False, 'error': repr(e)})
+    finally:
+        connection.close()
+
+
+def run_checks(
+        trees: list[str],
+        scale: float = 1.0,
+        seed: int = 0,
+        backend: str = 'Threads',
+        num_threads: Optional[int] = None,
+        workdir: Optional[str] = None
+    ) -> dict[str, Any]:
+    '''
+    Прогоняет все проверки на сгенерированных деревьях. Каждая проверка идёт в отдельном процессе,
+    как и замеры (см. run_benchmark). Возвращает отчёт; passed — прошли ли все проверки
+    '''
+    workdir = workdir or os.path.join(tempfile.gettempdir(), 'disk_analyzer_bench')
+    os.makedirs(workdir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    results: list[dict[str, Any]] = []
+    for tree in trees:
+        root, _ = generate_tree(tree, workdir, scale, seed)
+        db_path = os.path.join(workdir, f'{tree}.check.db')
+        for name in CHECKS:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_child, args=(sender, name, root, db_path, backend, num_threads))
+            process.start()
+            sender.close()
+            results.append({'tree': tree, 'check': name, **receiver.recv()})
+            process.join()
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    return {
+        'passed': all(result['passed'] for result in results),
+        'parameters': {
+            'scale': scale,
+            'seed': seed,
+            'backend': backend,
+            'num_threads': num_threads
+        },
+        'results': results
+    }
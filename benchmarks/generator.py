@@ -0,0 +1,111 @@
+import os
+import json
+import random
+import shutil
+from typing import Callable
+
+
+# Все генераторы детерминированы: одно и то же зерно и масштаб дают одинаковое дерево
+TreeBuilder = Callable[[str, random.Random, float], None]
+
+
+def _write_file(path: str, size: int) -> None:
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def _build_wide(root: str, rnd: random.Random, scale: float) -> None:
+    '''Широкое плоское дерево: много файлов и папок прямо в корне'''
+    for i in range(int(5000 * scale)):
+        _write_file(os.path.join(root, f'file_{i}.bin'), rnd.randint(0, 4096))
+    for i in range(int(2000 * scale)):
+        folder = os.path.join(root, f'folder_{i}')
+        os.mkdir(folder)
+        for j in range(5):
+            _write_file(os.path.join(folder, f'file_{j}.bin'), rnd.randint(0, 4096))
+
+
+def _build_deep(root: str, rnd: random.Random, scale: float) -> None:
+    '''Глубокое узкое дерево: длинная цепочка уровней с соседней папкой на каждом'''
+    current = root
+    for level in range(min(int(500 * scale), 1500)):
+        for j in range(3):
+            _write_file(os.path.join(current, f'f{j}'), rnd.randint(0, 4096))
+        leaf = os.path.join(current, 'l')
+        os.mkdir(leaf)
+        _write_file(os.path.join(leaf, 'f'), rnd.randint(1, 4096))
+        current = os.path.join(current, 'd')
+        os.mkdir(current)
+        if level % 100 == 99:
+            # Не упираемся в ограничение длины пути: начинаем новую ветку от корня
+            current = os.path.join(root, f'branch_{level}')
+            os.mkdir(current)
+
+
+def _build_tiny_files(root: str, rnd: random.Random, scale: float) -> None:
+    '''Много крошечных файлов в разветвлённом дереве (10 x 10 x 10 папок)'''
+    files_per_folder = max(1, int(100 * scale))
+    folders = [root]
+    for _ in range(3):
+        next_folders: list[str] = []
+        for folder in folders:
+            for i in range(10):
+                child = os.path.join(folder, f'dir_{i}')
+                os.mkdir(child)
+                next_folders.append(child)
+        folders = next_folders
+        for folder in folders:
+            for i in range(files_per_folder):
+                _write_file(os.path.join(folder, f'tiny_{i}'), rnd.randint(1, 64))
+
+
+def _build_chains(root: str, rnd: random.Random, scale: float) -> None:
+    '''Цепочки папок с единственной подпапкой (их схлопывает _collapse_folders)'''
+    for i in range(int(500 * scale)):
+        current = os.path.join(root, f'chain_{i}')
+        os.mkdir(current)
+        for level in range(rnd.randint(1, 20)):
+            current = os.path.join(current, f'link_{level}')
+            os.mkdir(current)
+        # Часть цепочек заканчивается пустой папкой и должна быть удалена целиком
+        if rnd.random() < 0.8:
+            for j in range(rnd.randint(1, 5)):
+                _write_file(os.path.join(current, f'file_{j}'), rnd.randint(1, 4096))
+
+
+TREES: dict[str, TreeBuilder] = {
+    'wide': _build_wide,
+    'deep': _build_deep,
+    'tiny_files': _build_tiny_files,
+    'chains': _build_chains,
+}
+
+
+def _count_entries(root: str) -> dict[str, int]:
+    folders = files = size = 0
+    for dirpath, _, filenames in os.walk(root):
+        folders += 1
+        files += len(filenames)
+        for filename in filenames:
+            size += os.path.getsize(os.path.join(dirpath, filename))
+    return {'folders': folders, 'files': files, 'bytes': size}
+
+
+def generate_tree(name: str, workdir: str, scale: float = 1.0, seed: int = 0) -> tuple[str, dict[str, int]]:
+    '''
+    Создаёт синтетическое дерево в workdir и возвращает путь к нему и число папок/файлов/байт.
+    Уже созданное дерево с теми же параметрами используется повторно.
+    '''
+    root = os.path.join(workdir, f'{name}-{scale:g}-{seed}')
+    marker = root + '.complete'
+    if os.path.exists(marker):
+        with open(marker, 'r') as f:
+            return root, json.load(f)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+    TREES[name](root, random.Random(seed), scale)
+    stats = _count_entries(root)
+    with open(marker, 'w') as f:
+        json.dump(stats, f)
+    return root, stats
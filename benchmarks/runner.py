@@ -0,0 +1,134 @@
+import os
+import gc
+import sys
+import time
+import platform
+import tempfile
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Optional
+
+from benchmarks.generator import generate_tree
+
+
+def _max_rss_kb() -> Optional[int]:
+    '''Пиковый RSS процесса в КБ (None, если платформа не даёт его узнать)'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS отдаёт байты, Linux — килобайты
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+
+def _measure_phases(root: str, db_path: str, backend: str, num_threads: Optional[int]) -> dict[str, Any]:
+    '''
+    Прогоняет фазы SizeFinder.run по отдельности и замеряет каждую.
+    Выполняется в отдельном процессе, чтобы пиковый RSS не зависел от предыдущих прогонов.
+    '''
+    # Импорт здесь: главный процесс бенчмарка не трогает конфиг и лог приложения
+    from logic import SizeFinder, Database
+
+    finder = SizeFinder(Database(db_path), root, num_threads, backend=backend)
+    phases: dict[str, dict[str, Any]] = {}
+
+    def measure(name: str, action: Callable[[], Any]) -> None:
+        start = time.perf_counter()
+        action()
+        phases[name] = {
+            'seconds': time.perf_counter() - start,
+            'max_rss_kb': _max_rss_kb()
+        }
+
+    # Те же шаги, что и в SizeFinder.run, но с замером каждой фазы
+    measure('prepare', finder._prepare) # pyright: ignore[reportPrivateUsage]
+    measure('scan', finder._scan) # pyright: ignore[reportPrivateUsage]
+    measure('aggregate_sizes', finder._aggregate_sizes) # pyright: ignore[reportPrivateUsage]
+    measure('collapse_folders', finder._collapse_folders) # pyright: ignore[reportPrivateUsage]
+    measure('write_database', finder._write_database) # pyright: ignore[reportPrivateUsage]
+    gc.enable()
+    finder.database.close()
+
+    return {
+        'phases': phases,
+        'total_seconds': sum(phase['seconds'] for phase in phases.values()),
+        'db_bytes': os.path.getsize(db_path),
+        # Счётчики сканера и накопленное время шагов записи бд
+        'counters': finder.stats.totals(finder.table.lock_wait),
+        'timers': dict(finder.stats.timers)
+    }
+
+
+def _child(connection: Connection, *args: Any) -> None:
+    try:
+        connection.send(_measure_phases(*args))
+    except Exception as e:
+        connection.send({'error': repr(e)})
+    finally:
+        connection.close()
+
+
+def run_benchmark(
+        trees: list[str],
+        scale: float = 1.0,
+        seed: int = 0,
+        backend: str = 'Threads',
+        num_threads: Optional[int] = None,
+        repeat: int = 1,
+        workdir: Optional[str] = None
+    ) -> dict[str, Any]:
+    '''
+    Генерирует (или берёт готовые) деревья и замеряет на них сканер.
+    Возвращает отчёт, пригодный для сериализации в JSON.
+    '''
+    workdir = workdir or os.path.join(tempfile.gettempdir(), 'disk_analyzer_bench')
+    os.makedirs(workdir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    results: list[dict[str, Any]] = []
+    for name in trees:
+        root, stats = generate_tree(name, workdir, scale, seed)
+        db_path = os.path.join(workdir, f'{name}.db')
+        runs: list[dict[str, Any]] = []
+        for _ in range(repeat):
+            # Каждый прогон — с чистой бд: иначе он начнёт с числа потоков, подобранного предыдущим
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_child, args=(sender, root, db_path, backend, num_threads))
+            process.start()
+            sender.close()
+            runs.append(receiver.recv())
+            process.join()
+
+        measured = [run for run in runs if 'phases' in run]
+        best: dict[str, float] = {}
+        for run in measured:
+            for phase, values in run['phases'].items():
+                best[phase] = min(best.get(phase, values['seconds']), values['seconds'])
+        results.append({
+            'tree': name,
+            'path': root,
+            'entries': stats,
+            'runs': runs,
+            'best_seconds': best
+        })
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    return {
+        'environment': {
+            'python': sys.version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'parameters': {
+            'scale': scale,
+            'seed': seed,
+            'backend': backend,
+            'num_threads': num_threads,
+            'repeat': repeat
+        },
+        'results': results
+    }
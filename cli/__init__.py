@@ -0,0 +1,5 @@
+from .scan import scan_roots, normalize_root
+from .report import top_entries, KINDS
+
+
+__all__ = ["scan_roots", "normalize_root", "top_entries", "KINDS"]
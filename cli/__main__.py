@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import argparse
+
+from cli import KINDS, normalize_root, scan_roots, top_entries
+from config import DATA_DIR, TRANSLATOR
+from logic import Database
+from logic.get_size import BACKENDS
+from utils import create_database, format_bytes
+
+
+_ = TRANSLATOR.gettext('cli')
+
+
+def _scan(args: argparse.Namespace) -> int:
+    try:
+        results = scan_roots(
+            args.roots, args.output_dir, args.threads, args.ignore,
+            not args.no_default_ignore, args.backend, args.incremental, args.hardlinks_once,
+            None if args.quiet else sys.stderr
+        )
+    except KeyboardInterrupt:
+        return 130
+    for root, path in results.items():
+        sys.stdout.write(f'{root}\t{path or "-"}\n')
+    return 0 if all(results.values()) else 1
+
+
+def _top(args: argparse.Namespace) -> int:
+    # Можно указать файл бд или просканированный корень
+    if args.database.endswith('.db') and os.path.isfile(args.database):
+        database = Database(args.database)
+    else:
+        database = create_database(normalize_root(args.database), args.db_dir)
+    database.open()
+    if not database.is_open:
+        sys.stderr.write(_('Database not found: {path}').format(path=database.path) + '\n')
+        return 1
+    try:
+        under = normalize_root(args.under) if args.under else None
+        entries = top_entries(database, args.count, args.kind, under, args.allocated)
+    finally:
+        database.close()
+
+    if args.json:
+        sys.stdout.write(json.dumps([{'path': path, 'size': size} for size, path in entries], indent=4, ensure_ascii=False) + '\n')
+    else:
+        for size, path in entries:
+            sys.stdout.write(f'{format_bytes(size):>12}\t{path}\n')
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m cli',
+        description=_('Scanning and reports without the graphical interface.')
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    scan = commands.add_parser('scan', help=_('Scan folders and write databases'))
+    scan.add_argument('roots', nargs='+', help=_('Folders to scan'))
+    scan.add_argument('--output-dir', default=DATA_DIR, help=_('Where to write databases (default: the program data folder)'))
+    scan.add_argument('--threads', type=int, default=None, help=_('Number of scanner threads (default: tuned during the scan)'))
+    scan.add_argument('--backend', default='Threads', choices=BACKENDS)
+    scan.add_argument('--ignore', action='append', default=[], metavar='PATH', help=_('Do not scan this folder (can be given several times)'))
+    scan.add_argument('--no-default-ignore', action='store_true', help=_('Do not skip system folders (/proc, /sys, etc.)'))
+    scan.add_argument('--incremental', action='store_true', help=_('Rescan only changed folders'))
+    scan.add_argument('--hardlinks-once', action='store_true', help=_('Count a file with several hard links once'))
+    scan.add_argument('--quiet', action='store_true', help=_('Do not print progress'))
+    scan.set_defaults(handler=_scan)
+
+    top = commands.add_parser('top', help=_('Largest folders or files from a database'))
+    top.add_argument('database', help=_('Database file or scanned folder'))
+    top.add_argument('--db-dir', default=DATA_DIR, help=_('Where to look for the database of a scanned folder'))
+    top.add_argument('-n', '--count', type=int, default=20)
+    top.add_argument('--kind', default='folders', choices=KINDS)
+    top.add_argument('--under', default=None, help=_('Only inside this folder'))
+    top.add_argument('--allocated', action='store_true', help=_('Compare allocated space (st_blocks) instead of size'))
+    top.add_argument('--json', action='store_true', help=_('Print the report as JSON'))
+    top.set_defaults(handler=_top)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
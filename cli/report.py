@@ -0,0 +1,50 @@
+import os
+import heapq
+import pickle
+import compression.zstd
+from typing import Iterator, Optional
+
+from logic import Database
+
+
+KINDS = ['folders', 'files']
+
+
+def _is_inside(path: str, prefix: str) -> bool:
+    return path.startswith(prefix) or path == prefix.rstrip('/\\')
+
+
+def _iter_sizes(database: Database, kind: str, under: Optional[str], field: str) -> Iterator[tuple[int, str]]:
+    '''
+    Пары (размер, путь) всех папок или всех файлов бд, лежащих внутри under (None — везде).
+    field — 's' (размер) или 'a' (место на диске; в бд старой версии его нет, тогда берётся размер)
+    '''
+    prefix = os.path.join(under.rstrip('/\\'), '') if under else ''
+    for key, record in database.items():
+        # Служебные ключи (__root__, __date__ и т.п.)
+        if key.startswith('__') or not isinstance(record, dict):
+            continue
+        if not _is_inside(key, prefix):
+            continue
+        if kind == 'folders':
+            yield record.get(field, record['s']), key
+            continue
+        # Файлы папки лежат прямо в ней, поэтому их путь проверять не нужно
+        for file in pickle.loads(compression.zstd.decompress(record['files'])):
+            yield file.get(field, file['s']), file['p']
+
+
+def top_entries(
+        database: Database, count: int, kind: str = 'folders',
+        under: Optional[str] = None, allocated: bool = False
+    ) -> list[tuple[int, str]]:
+    '''
+    count самых больших папок или файлов бд: [(размер, путь)] по убыванию размера.
+    Читает бд одним проходом и держит в памяти только count лучших элементов.
+    Размер папки — полный, вместе со всем содержимым, поэтому папки-предки крупных папок
+    тоже попадают в список; under ограничивает выборку поддеревом.
+    allocated — сравнивать место на диске вместо размера
+    '''
+    if kind not in KINDS:
+        raise ValueError(f'Неизвестный тип элементов: {kind}')
+    return heapq.nlargest(count, _iter_sizes(database, kind, under, 'a' if allocated else 's'))
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Optional, TextIO
+
+from config import IGNORE_PATHS, TRANSLATOR
+from logic import SizeFinder
+from utils import create_database, format_bytes
+
+
+_ = TRANSLATOR.gettext('cli')
+
+# Как часто печатается прогресс сканирования, секунд
+PROGRESS_INTERVAL = 5.0
+
+
+def normalize_root(path: str) -> str:
+    '''Абсолютный путь в том виде, в каком его хранит SizeFinder'''
+    return os.path.normpath(os.path.abspath(path))
+
+
+def scan_roots(
+        roots: list[str],
+        output_dir: str,
+        num_threads: Optional[int] = None,
+        ignore_paths: Optional[list[str]] = None,
+        use_default_ignore: bool = True,
+        backend: str = 'Threads',
+        incremental: bool = False,
+        count_hardlinks_once: bool = False,
+        progress: Optional[TextIO] = sys.stderr
+    ) -> dict[str, Optional[str]]:
+    '''
+    Сканирует каждый корень в свою бд в папке output_dir (имя бд такое же, как у бд окна индексации,
+    поэтому визуализатор находит их, если output_dir — папка данных программы).
+    Возвращает {корень: путь к бд или None, если сканирование не удалось или прервано}
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    ignore = {normalize_root(path) for path in ignore_paths or []}
+    if use_default_ignore:
+        ignore |= IGNORE_PATHS
+
+    results: dict[str, Optional[str]] = {}
+    for root in map(normalize_root, roots):
+        database = create_database(root, output_dir)
+        finder = SizeFinder(database, root, num_threads, incremental, backend, ignore, count_hardlinks_once)
+        _print(progress, _('Scanning {root} -> {path}').format(root=root, path=database.path))
+        start = time.perf_counter()
+        try:
+            is_finished = _run_with_progress(finder, progress)
+        except Exception as e:
+            logging.error(f'Ошибка при сканировании {root}: {e}')
+            _print(progress, _('Error while scanning {root}: {error}').format(root=root, error=e))
+            is_finished = False
+        finally:
+            database.close()
+        if is_finished:
+            _print(progress, _('Done in {seconds:.1f} s: {size}. Trace: {trace}').format(
+                seconds=time.perf_counter() - start, size=format_bytes(finder.table.total_size[0]), trace=finder.trace_path()
+            ))
+        results[root] = database.path if is_finished else None
+    return results
+
+
+def _run_with_progress(finder: SizeFinder, progress: Optional[TextIO]) -> bool:
+    '''
+    Запускает SizeFinder.run в отдельном потоке и печатает прогресс.
+    Ctrl+C останавливает сканирование так же, как кнопка прерывания в окне индексации
+    '''
+    result: list[bool] = []
+
+    def run() -> None:
+        try:
+            result.append(finder.run())
+        except Exception as e:
+            logging.exception('Ошибка при сканировании')
+            result.append(False)
+            _print(progress, _('Error while scanning: {error}').format(error=e))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(PROGRESS_INTERVAL)
+            if thread.is_alive():
+                total = f' / {format_bytes(finder.total)}' if finder.total else ''
+                sample = finder.stats.last_sample
+                rates = ''
+                if sample is not None:
+                    rates = ' | ' + _('{directories} folders/s, {speed}/s, queued {queued}').format(
+                        directories=int(sample['directories_per_second']),
+                        speed=format_bytes(sample['bytes_per_second']),
+                        queued=sample['queue_depth']
+                    )
+                _print(progress, _('Processed:') + f' {format_bytes(finder.current)}{total}{rates}')
+    except KeyboardInterrupt:
+        _print(progress, _('Stopping...'))
+        finder.is_running = False
+        thread.join()
+        raise
+    return bool(result and result[0])
+
+
+def _print(stream: Optional[TextIO], text: str) -> None:
+    if stream is not None:
+        stream.write(text + '\n')
+        stream.flush()
@@ -3,6 +3,7 @@ import sys
 import locale
 import platform
 import logging
+import multiprocessing
 
 from settings import Settings
 from translator import Translator
@@ -61,10 +62,14 @@ def set_default_values() -> None:
     is_should_run_visualizer = True
     is_should_run_analyzer = False
 
-logging.basicConfig(level=logging.INFO, filename=os.path.join(DATA_DIR, "log.log"), encoding='utf-8', filemode='w', format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
+# Дочерние процессы сканера импортируют конфиг заново: они не должны затирать лог, настройки и переводы
+IS_MAIN_PROCESS = multiprocessing.current_process().name == 'MainProcess'
+
+logging.basicConfig(level=logging.INFO, filename=os.path.join(DATA_DIR, "log.log"), encoding='utf-8', filemode='w' if IS_MAIN_PROCESS else 'a', format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s')
 logging.info(f'Конфигурационный файл успешно запущен. {CURRENT_DIR=}. {DATA_DIR=}. {PLATFORM=}. {IGNORE_PATHS=}. {LANGUAGE=}. {is_should_run_visualizer=}. {is_should_run_analyzer=}.')
 
-SETTINGS = Settings(os.path.join(DATA_DIR, "settings.json"))
+SETTINGS = Settings(os.path.join(DATA_DIR, "settings.json"), read_only=not IS_MAIN_PROCESS)
 
 TRANSLATOR = Translator()
-TRANSLATOR.change_language(SETTINGS['language']['current'])
+if IS_MAIN_PROCESS:
+    TRANSLATOR.change_language(SETTINGS['language']['current'])
@@ -1,6 +1,9 @@
 from .database import Database
+from .record_cache import RecordCache
+from .search_index import SearchIndex
 from .disk_info import get_start_directories, get_used_disk_size, is_root
+from .scan_stats import ScanStats
 from .get_size import SizeFinder
 
 
-__all__ = ["get_start_directories", "get_used_disk_size", "SizeFinder", "Database", "is_root"]
+__all__ = ["get_start_directories", "get_used_disk_size", "SizeFinder", "Database", "RecordCache", "SearchIndex", "ScanStats", "is_root"]
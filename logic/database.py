@@ -1,23 +1,89 @@
 import os
+import mmap
 import struct
 import marshal
-from typing import Any
+import hashlib
+import threading
+from array import array
+from typing import Any, Iterator, Optional
+
+
+# Формат файла:
+# [заголовок][записи: байты ключа + значение marshal]...[секции][служебные ключи marshal][таблица слотов]
+# Секции — произвольные двоичные блоки (например, поисковый индекс), выровненные по 8 байт.
+# Их расположение хранится в служебном ключе __sections__
+MAGIC = b'DiskAnDB'
+VERSION = 2
+# magic, версия, резерв, смещение и длина служебных ключей, смещение и число слотов
+HEADER = struct.Struct('<8sIIQQQQ')
+# Слот хеш-таблицы с открытой адресацией: хеш ключа (0 — пустой слот), смещение записи, длина ключа, длина значения
+SLOT = struct.Struct('<QQII')
+# Максимальная заполненность таблицы слотов
+MAX_LOAD = 0.7
+
+
+def _encode_key(key: str) -> bytes:
+    # surrogatepass: пути из os.fsdecode могут содержать одиночные суррогаты
+    return key.encode('utf-8', 'surrogatepass')
+
+
+def _hash_key(key_bytes: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little') or 1
+
+
+def _is_meta_key(key: str) -> bool:
+    '''Служебные ключи (__root__, __date__ и т.п.) хранятся отдельно и читаются сразу при открытии'''
+    return key.startswith('__')
 
 
 class Database:
-    def __init__(self, path: str):
+    '''
+    Бд вида {ключ: значение marshal}.
+    По умолчанию файл отображается в память (mmap): чтение — срез memoryview без копирования
+    и без общего курсора файла, поэтому бд можно читать из нескольких потоков без блокировок.
+
+    Индекс — хеш-таблица с фиксированными слотами прямо в файле: при открытии читаются только
+    заголовок и служебные ключи, а поиск ключа — несколько чтений слотов.
+    Старый формат (marshal-словарь индекса в конце файла) тоже читается.
+    '''
+    def __init__(self, path: str, use_mmap: bool = True):
         self.path = path
+        self.use_mmap = use_mmap
         self.is_open = False
+        self.mm: Optional[mmap.mmap] = None
+        self.view: Optional[memoryview] = None
+        # Нужна только при чтении через файл (без mmap)
+        self._file_lock = threading.Lock()
+        # Служебные ключи
+        self.meta: dict[str, Any] = {}
+        # Индекс старого формата {ключ: (смещение, длина)}, None для нового формата
+        self.index: Optional[dict[str, tuple[int, int]]] = None
+        self.slots_offset = 0
+        self.slot_count = 0
+        # {имя секции: (смещение, длина)}
+        self.sections: dict[str, tuple[int, int]] = {}
 
     def __del__(self):
         if self.is_open:
-            self.close()
+            try:
+                self.close()
+            except BufferError:
+                # Срезы ещё живы: отображение освободится вместе с ними
+                pass
 
-    def __iter__(self):
-        return iter(self.index)
+    def __iter__(self) -> Iterator[str]:
+        if not self.is_open:
+            return iter(())
+        if self.index is not None:
+            return iter(self.index)
+        return self._iter_keys()
 
     def __contains__(self, key: str):
-        return key in self.index
+        if not self.is_open:
+            return False
+        if self.index is not None:
+            return key in self.index
+        return key in self.meta or self._find(key) is not None
 
     def __getitem__(self, key: str):
         val = self.get(key)
@@ -28,49 +94,115 @@ class Database:
     def get(self, key: str):
         if not self.is_open:
             return None
-        try:
-            offset, length = self.index[key]
-        except KeyError:
+        if self.index is not None:
+            location = self.index.get(key)
+        elif _is_meta_key(key):
+            return self.meta.get(key)
+        else:
+            location = self._find(key)
+        if location is None:
+            return None
+
+        offset, length = location
+        view = self.view
+        if view is not None:
+            with view[offset:offset + length] as raw_data:
+                return marshal.loads(raw_data)
+        return marshal.loads(self._read(offset, length))
+
+    def _read(self, offset: int, length: int) -> bytes | memoryview:
+        view = self.view
+        if view is not None:
+            return view[offset:offset + length]
+        with self._file_lock:
+            self.f.seek(offset)
+            return self.f.read(length)
+
+    def _slot(self, slot: int) -> tuple[int, int, int, int]:
+        position = self.slots_offset + slot * SLOT.size
+        view = self.view
+        if view is not None:
+            return SLOT.unpack_from(view, position)
+        return SLOT.unpack(self._read(position, SLOT.size))
+
+    def _find(self, key: str) -> Optional[tuple[int, int]]:
+        '''
+        Ищет ключ в таблице слотов. Возвращает (смещение, длина) значения
+        '''
+        if not self.slot_count:
+            return None
+        key_bytes = _encode_key(key)
+        key_hash = _hash_key(key_bytes)
+        mask = self.slot_count - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash, offset, key_length, value_length = self._slot(slot)
+            if slot_hash == 0:
+                return None
+            if slot_hash == key_hash and key_length == len(key_bytes) and self._read(offset, key_length) == key_bytes:
+                return offset + key_length, value_length
+            slot = (slot + 1) & mask
+
+    def section(self, name: str) -> Optional[bytes | memoryview]:
+        '''
+        Содержимое секции (при mmap — без копирования) или None, если её нет
+        '''
+        location = self.sections.get(name) if self.is_open else None
+        if location is None:
             return None
-            
-        self.f.seek(offset)
-        raw_data = self.f.read(length)
-        return marshal.loads(raw_data)
+        return self._read(*location)
+
+    def find_in_section(self, name: str, sub: bytes, start: int = 0) -> int:
+        '''
+        Поиск подстроки в секции, начиная с позиции start (относительно начала секции).
+        Возвращает позицию относительно начала секции или -1
+        '''
+        offset, length = self.sections[name]
+        mm = self.mm
+        if mm is not None:
+            position = mm.find(sub, offset + start, offset + length)
+            return position - offset if position != -1 else -1
+        return bytes(self._read(offset, length)).find(sub, start)
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        '''
+        Все пары (ключ, значение) одним проходом по таблице слотов, без поиска каждого ключа
+        '''
+        if not self.is_open:
+            return
+        if self.index is not None:
+            for key in list(self.index):
+                yield key, self.get(key)
+            return
+        yield from list(self.meta.items())
+        for slot in range(self.slot_count):
+            slot_hash, offset, key_length, value_length = self._slot(slot)
+            if slot_hash:
+                key = bytes(self._read(offset, key_length)).decode('utf-8', 'surrogatepass')
+                yield key, marshal.loads(self._read(offset + key_length, value_length))
+
+    def _iter_keys(self) -> Iterator[str]:
+        yield from list(self.meta)
+        for slot in range(self.slot_count):
+            slot_hash, offset, key_length, _ = self._slot(slot)
+            if slot_hash:
+                yield bytes(self._read(offset, key_length)).decode('utf-8', 'surrogatepass')
 
     def create_db(self, source_dict: dict[str, Any], open_after: bool = True):
         """
         source_dict: Словарь данных для загрузки в бд.
         open_after: Открывать ли после загрузки
         """
-        if self.is_open:
-            self.close()
-        try:
-            index: dict[str, tuple[int, int]] = {}  # {ключ: (смещение, длина)}
-            
-            with open(self.path, 'wb') as f:
-                for key, value in source_dict.items():
-                    # 1. Сериализуем данные в бинарный формат
-                    data_bytes = marshal.dumps(value)
-                    length = len(data_bytes)
-                    
-                    offset = f.tell()
-                    # 2. Пишем данные
-                    f.write(data_bytes)
-                    
-                    # 3. Запоминаем, где они лежат
-                    index[key] = (offset, length)
-                    
-                # 4. В конце файла пишем сам индекс
-                index_bytes = marshal.dumps(index)
-                start_of_index = f.tell()
-                f.write(index_bytes)
-                
-                # 5. В последние 8 байт пишем, где начинается индекс
-                # <Q означает unsigned long long (8 байт)
-                f.write(struct.pack('<Q', start_of_index))
-        finally:
-            if open_after:
-                self.open()
+        with self.writer(open_after) as writer:
+            for key, value in source_dict.items():
+                writer.add(key, value)
+
+    def writer(self, open_after: bool = True) -> 'DatabaseWriter':
+        """
+        Потоковая запись бд (см. DatabaseWriter).
+        open_after: Открывать ли после загрузки
+        """
+        return DatabaseWriter(self, open_after)
 
     def open(self):
         '''
@@ -83,23 +215,181 @@ class Database:
             return
         self.f = open(self.path, 'rb')
         self.is_open = True
-        
+        if self.use_mmap:
+            try:
+                self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mm)
+            except (OSError, ValueError):
+                # Пустой файл отобразить нельзя: читаем по-старому
+                self.mm = self.view = None
+
+        try:
+            self._open_header()
+        except Exception:
+            # Пустой, повреждённый или чужой версии файл не оставляет бд наполовину открытой
+            self.close()
+            raise
+
+    def _open_header(self):
+        # Копия, а не срез: срез в кадре исключения не дал бы закрыть отображение
+        header = bytes(self._read(0, HEADER.size))
+        if len(header) == HEADER.size and header[:len(MAGIC)] == MAGIC:
+            _, version, _, meta_offset, meta_length, self.slots_offset, self.slot_count = HEADER.unpack(header)
+            if version != VERSION:
+                raise ValueError(f'Неподдерживаемая версия бд: {version}')
+            self.index = None
+            self.meta = marshal.loads(self._read(meta_offset, meta_length))
+            self.sections = self.meta.pop('__sections__', {})
+            return
+        self._open_legacy()
+
+    def _open_legacy(self):
+        '''
+        Старый формат: весь индекс — marshal-словарь в конце файла
+        '''
+        size = os.fstat(self.f.fileno()).st_size
         # 1. Читаем последние 8 байт, чтобы найти начало индекса
-        self.f.seek(-8, 2) # 2 = конец файла
-        index_offset = struct.unpack('<Q', self.f.read(8))[0]
-        
+        index_offset = struct.unpack('<Q', self._read(size - 8, 8))[0]
         # 2. Читаем и загружаем индекс в память
-        self.f.seek(index_offset)
-        raw_index = self.f.read()
-        
         # Это словарь {key: (offset, length)}
-        self.index = marshal.loads(raw_index) 
+        self.index = marshal.loads(self._read(index_offset, size - index_offset))
 
     def close(self):
+        '''
+        Закрытие бд. Если на отображение ещё ссылаются срезы (например, поисковый индекс,
+        см. SearchIndex.close), бд остаётся открытой и выбрасывается BufferError:
+        файл, отображённый в память, нельзя ни заменить, ни удалить на Windows
+        '''
         if not self.is_open:
             return
-        self.f.close()
+        if self.view is not None and self.mm is not None:
+            try:
+                self.view.release()
+                self.mm.close()
+            except BufferError as e:
+                # Срезы держат отображение: оно остаётся рабочим, бд — открытой
+                self.view = memoryview(self.mm)
+                raise BufferError(f'Бд {self.path} нельзя закрыть: на её отображение в память ещё ссылаются') from e
+            self.mm = self.view = None
         self.is_open = False
+        self.f.close()
+        self.meta = {}
+        self.sections = {}
+        self.index = None
+        self.slot_count = 0
 
     def is_empty(self) -> bool:
         return not os.path.exists(self.path)
+
+
+class DatabaseWriter:
+    '''
+    Потоковая запись бд: записи уходят в файл сразу, в памяти остаются только
+    хеши, смещения и длины (компактные массивы), из которых в конце строится таблица слотов.
+    Пишется временный файл, который заменяет бд только после успешной записи,
+    поэтому старую бд можно читать, пока пишется новая.
+    Каждый ключ должен добавляться один раз.
+    '''
+    def __init__(self, database: Database, open_after: bool = True):
+        self.database = database
+        self.open_after = open_after
+        self.temp_path = database.path + '.tmp'
+        self.meta: dict[str, Any] = {}
+        self.sections: dict[str, tuple[int, int]] = {}
+        self.hashes = array('Q')
+        self.offsets = array('Q')
+        self.key_lengths = array('I')
+        self.value_lengths = array('I')
+        self.f = open(self.temp_path, 'wb')
+        # Место под заголовок: он записывается в конце, когда известны все смещения
+        self.f.write(bytes(HEADER.size))
+        self.offset = HEADER.size
+
+    def __enter__(self) -> 'DatabaseWriter':
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def add(self, key: str, value: Any):
+        if _is_meta_key(key):
+            self.meta[key] = value
+            return
+        self.add_raw(key, marshal.dumps(value))
+
+    def add_raw(self, key: str, data_bytes: bytes):
+        '''
+        Пишет уже сериализованную через marshal запись
+        '''
+        if _is_meta_key(key):
+            self.meta[key] = marshal.loads(data_bytes)
+            return
+        key_bytes = _encode_key(key)
+        self.f.write(key_bytes)
+        self.f.write(data_bytes)
+        self.hashes.append(_hash_key(key_bytes))
+        self.offsets.append(self.offset)
+        self.key_lengths.append(len(key_bytes))
+        self.value_lengths.append(len(data_bytes))
+        self.offset += len(key_bytes) + len(data_bytes)
+
+    def add_section(self, name: str, data: bytes | bytearray | memoryview):
+        '''
+        Пишет двоичную секцию. Начало выравнивается по 8 байт, чтобы её можно было
+        читать как массив чисел через memoryview.cast
+        '''
+        padding = -self.offset % 8
+        self.f.write(bytes(padding))
+        self.offset += padding
+        self.f.write(data)
+        self.sections[name] = (self.offset, len(data))
+        self.offset += len(data)
+
+    def _build_slots(self) -> tuple[bytearray, int]:
+        '''
+        Раскладывает записи по слотам (линейное пробирование). Размер таблицы — степень двойки
+        '''
+        slot_count = 1 << max(3, int(len(self.hashes) / MAX_LOAD).bit_length())
+        mask = slot_count - 1
+        taken = bytearray(slot_count)
+        slots = bytearray(slot_count * SLOT.size)
+        for i, key_hash in enumerate(self.hashes):
+            slot = key_hash & mask
+            while taken[slot]:
+                slot = (slot + 1) & mask
+            taken[slot] = 1
+            SLOT.pack_into(slots, slot * SLOT.size, key_hash, self.offsets[i], self.key_lengths[i], self.value_lengths[i])
+        return slots, slot_count
+
+    def commit(self):
+        try:
+            if self.sections:
+                self.meta['__sections__'] = self.sections
+            meta_bytes = marshal.dumps(self.meta)
+            meta_offset = self.offset
+            self.f.write(meta_bytes)
+            slots, slot_count = self._build_slots()
+            slots_offset = meta_offset + len(meta_bytes)
+            self.f.write(slots)
+            self.f.seek(0)
+            self.f.write(HEADER.pack(MAGIC, VERSION, 0, meta_offset, len(meta_bytes), slots_offset, slot_count))
+            self.f.close()
+            # Открытый файл нельзя заменить на Windows
+            self.database.close()
+            os.replace(self.temp_path, self.database.path)
+        except:
+            self.abort()
+            raise
+        if self.open_after:
+            self.database.open()
+
+    def abort(self):
+        '''
+        Отменяет запись, старая бд остаётся нетронутой
+        '''
+        self.f.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -1,240 +1,737 @@
 import os
 import gc
+import time
 import pickle
+import marshal
 import logging
 import threading
+import multiprocessing
+from array import array
 import compression.zstd
+from collections import deque
 from datetime import datetime
-from queue import Queue, ShutDown
-from typing import Optional, Any
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait
+from multiprocessing.synchronize import Event
+from multiprocessing.sharedctypes import SynchronizedArray
+from typing import Optional, Any, Callable, Iterable, Iterator
 
 from config import IGNORE_PATHS
 from logic import Database, get_used_disk_size, is_root
+from logic.node_table import NodeTable, IS_DIR
+from logic.scan_stats import ScanStats, SAMPLE_INTERVAL
+from logic.work_queue import WorkStealingQueue, InodeOrderQueue
+from logic.thread_tuner import ThreadTuner, AUTO_MAX_THREADS, TUNE_STEP_SECONDS
+from logic.search_index import SearchIndexBuilder
+from logic.inode_set import InodeSet
+
+
+BACKENDS = ['Threads', 'Processes', 'Inode order']
+# Папок в работе одновременно в режиме Inode order (если число потоков не задано явно).
+# HDD выигрывает от порядка запросов, а не от их количества: с большим числом потоков они снова идут вразброс
+INODE_ORDER_THREADS = 4
+# Потоков внутри каждого процесса: они перекрывают ожидание диска, а GIL у каждого процесса свой
+PROCESS_WORKER_THREADS = 4
+# Верхние уровни, которые обходятся в главном процессе для разбиения на поддеревья
+FRONTIER_MAX_DEPTH = 3
+# Сколько поддеревьев приходится на один процесс (для балансировки нагрузки)
+SUBTREES_PER_PROCESS = 4
+# Сколько элементов (файлов и подпапок) сериализуется одной задачей при записи бд
+WRITE_BATCH_ENTRIES = 2048
+# Служебный ключ бд: число потоков, подобранное при прошлом сканировании этого корня
+THREADS_KEY = '__threads__'
+# Ячейки общего счётчика прогресса процессов: байты, папки, файлы
+PROGRESS_BYTES, PROGRESS_DIRECTORIES, PROGRESS_FILES = range(3)
+# На Windows у stat нет st_blocks: занятое место там считается равным размеру
+HAS_BLOCKS = hasattr(os.stat_result, 'st_blocks')
+
+# Отпечаток папки: (mtime, ctime, inode, устройство)
+Signature = tuple[int, int, int, int]
+# Папка в очереди: (индекс узла, путь, устройство родителя, отпечаток, если уже известен)
+DirectoryItem = tuple[int, str, Optional[int], Optional[Signature]]
+DirectoryQueue = WorkStealingQueue[DirectoryItem] | InodeOrderQueue[DirectoryItem]
+# Файл с несколькими жёсткими ссылками в этой папке: (номер, устройство, inode)
+LinkedFile = tuple[int, int, int]
+
+# Запись папки до сериализации: (путь, подпапки, файлы, размер, занятое место, отпечаток,
+# имена всех прямых подпапок, число файлов с несколькими жёсткими ссылками)
+FolderRecord = tuple[str, list[dict[str, Any]], list[dict[str, Any]], int, int, Optional[tuple[int, int, int, int]], list[str], int]
 
 
 class SizeFinder:
-    def __init__(self, database: Database, path: str, num_threads: Optional[int] = None) -> None:
+    def __init__(
+            self,
+            database: Database,
+            path: str,
+            num_threads: Optional[int] = None,
+            incremental: bool = False,
+            backend: str = 'Threads',
+            ignore_paths: Optional[set[str]] = None,
+            count_hardlinks_once: bool = False
+        ) -> None:
         self.database = database
         self.starting_point = path
-        logging.info(f'Директория для обхода: {self.starting_point}')
-
+        self.incremental = incremental
+        # Файл с несколькими жёсткими ссылками учитывается один раз: при первой встреченной ссылке
+        self.count_hardlinks_once = count_hardlinks_once
+        self.backend = backend if backend in BACKENDS else 'Threads'
+        # Обход для HDD: записи папок и очередь папок упорядочены по inode, потоков немного
+        self.inode_order = self.backend == 'Inode order'
+        # Папки, которые не обходятся (по умолчанию — системные из конфига).
+        # Нормализуются здесь, чтобы при обходе сравнивать с entry.path без преобразований
+        self.ignore_paths = {self._normalize(path) for path in (IGNORE_PATHS if ignore_paths is None else ignore_paths)}
+        logging.info(f'Директория для обхода: {self.starting_point}. Инкрементальный режим: {self.incremental}. Бэкенд: {self.backend}. Жёсткие ссылки один раз: {self.count_hardlinks_once}. Игнорируемые пути: {self.ignore_paths}')
+
+        cpu_count = os.cpu_count() or 1
+        # Без явного числа потоков оно подбирается во время сканирования (см. ThreadTuner)
+        # и начинается с подобранного в прошлый раз. В режиме Inode order оно постоянное
+        self.auto_threads = not num_threads and not self.inode_order
         if num_threads:
             self.num_threads = num_threads
+        elif self.inode_order:
+            self.num_threads = INODE_ORDER_THREADS
         else:
-            cpu_count = os.cpu_count() or 1
-            
             self.num_threads = min(32, cpu_count * 4)
+        self.num_processes = cpu_count
+        # Число потоков из бд (прошлое сканирование) и подобранное в этом
+        self.stored_threads: Optional[int] = None
+        self.tuned_threads: Optional[int] = None
 
-        logging.info(f"Количество используемых потоков: {self.num_threads}")
+        logging.info(f"Количество используемых потоков: {self.num_threads}. Автоподбор: {self.auto_threads}")
 
-        # Основное хранилище данных
-        self.folders: dict[str, dict[str, Any]] = {}
-        self.to_change: dict[str, str] = {}
+        # Основное хранилище данных: колоночная таблица всех папок и файлов
+        self.table = NodeTable()
+        # Чем показывается каждая папка после коллапса (см. _collapse_folders)
+        self.collapse_to = array('i')
         self.total = 0
         self.current = 0
         self.is_running = False
+        # Счётчики и длительности фаз (см. sample_stats и файл трассировки рядом с бд)
+        self.stats = ScanStats()
+        # Поддеревья, ещё не досканированные процессами
+        self.pending_subtrees = 0
+        # Файлы с несколькими жёсткими ссылками (при count_hardlinks_once): тройки (узел, устройство, inode),
+        # не больше InodeSet.max_items. Какая из ссылок посчитана, решается после обхода (см. _count_links_once)
+        self.linked_files = array('Q')
+        # Не все файлы с жёсткими ссылками попали в linked_files: остальные посчитаны каждый раз
+        self.links_overflow = False
+        # Пары (устройство, inode) и узел, у которого файл посчитан
+        self.inodes = InodeSet()
         
         # Настройки многопоточности
-        self.queue: Queue[str | None] = Queue()
+        self.queue: DirectoryQueue = WorkStealingQueue(1)
+        # Номер текущего потока-обработчика (его дека в self.queue)
+        self._local = threading.local()
+        self._threads: list[threading.Thread] = []
         
         # Блокировки
         self.data_lock = threading.Lock()
         self.size_calc_lock = threading.Lock()
+        self.reused = 0
 
     def _normalize(self, path: str) -> str:
         """Приводит путь к стандартному виду для данной ОС."""
         return os.path.normpath(path)
 
-    def _process_directory(self, path: str) -> None:
+    def _get_signature(self, path: str) -> Optional[Signature]:
+        """
+        Возвращает отпечаток директории (mtime, ctime, inode, устройство).
+        Он меняется при добавлении, удалении или переименовании записей внутри неё.
+        Нужен только для корня и папок из старой бд: остальным отпечаток снимает родитель (см. _process_directory).
+        """
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, stat.st_dev)
+
+    def _reuse_directory(self, node: int, path: str, signature: Optional[Signature]) -> bool:
         """
-        Сканирует одну директорию, считает файлы и собирает пути к подпапкам.
+        Берёт содержимое директории из предыдущей базы, если директория не менялась.
+        Файлы и список подпапок не перечитываются с диска, но подпапки всё равно
+        проверяются: изменения внутри них не отражаются на mtime родителя.
+        """
+        if signature is None:
+            return False
+        record = self.database.get(path)
+        if not isinstance(record, dict) or record.get('m') != signature:
+            return False
+        # Папки с жёсткими ссылками перечитываются: размер таких файлов зависит от того,
+        # где ссылка встретилась раньше. Записи без занятого места — из старой версии бд
+        if record.get('h') or 'a' not in record:
+            return False
+
+        files: dict[str, tuple[int, int]] = {
+            file['n']: (file['s'], file['a']) for file in pickle.loads(compression.zstd.decompress(record['files']))
+        }
+        subfolders: list[str] = [
+            name for name in pickle.loads(compression.zstd.decompress(record['d']))
+            if os.path.join(path, name) not in self.ignore_paths
+        ]
+
+        self._store_directory(node, path, signature, files, subfolders, [None] * len(subfolders))
+        with self.size_calc_lock:
+            self.reused += 1
+        return True
+
+    def _store_directory(
+            self,
+            node: int,
+            path: str,
+            signature: Optional[Signature],
+            files: dict[str, tuple[int, int]],
+            subfolders: list[str],
+            subfolder_signatures: list[Optional[Signature]],
+            links: Optional[list[LinkedFile]] = None,
+            hardlinks: int = 0
+        ) -> None:
+        """
+        Записывает содержимое директории в таблицу и ставит подпапки в очередь
+        вместе с их отпечатками (None — подпапка снимет его сама).
+        files — {имя: (размер, занятое место)}, links — файлы с жёсткими ссылками, повторы которых
+        нужно искать (номер среди files), hardlinks — сколько всего файлов с несколькими ссылками в папке.
+        """
+        sizes = [size for size, _ in files.values()]
+        allocated = [size for _, size in files.values()]
+        current_folder_files_size = sum(sizes)
+
+        # Обновляем прогресс-бар и счётчики
+        with self.size_calc_lock:
+            self.current += current_folder_files_size
+            self.stats.count_directory(len(sizes), current_folder_files_size)
+
+        start = self.table.add_children(node, subfolders, list(files), sizes, allocated)
+        if signature is not None or hardlinks:
+            with self.data_lock:
+                if signature is not None:
+                    self.table.signatures[node] = signature
+                if hardlinks:
+                    self.table.hardlinks[node] = hardlinks
+        if links:
+            first_file = start + len(subfolders)
+            with self.data_lock:
+                room = self._links_room()
+                if len(links) > room:
+                    self.links_overflow = True
+                    links = links[:room]
+                for i, device, inode in links:
+                    self.linked_files.extend((first_file + i, device, inode))
+
+        device = signature[3] if signature is not None else None
+        # Все подпапки уходят в деку потока одной пачкой
+        self.queue.push(getattr(self._local, 'worker', 0), [
+            (start + i, os.path.join(path, name), device, subfolder_signatures[i])
+            for i, name in enumerate(subfolders)
+        ])
+
+    def _process_directory(
+            self,
+            node: int,
+            path: str,
+            parent_device: Optional[int] = None,
+            signature: Optional[Signature] = None
+        ) -> None:
+        """
+        Сканирует одну директорию, считает файлы и собирает имена подпапок.
+
+        path уже нормализован: корень нормализуется один раз, остальные пути собираются из него.
+        Тип элемента берётся из d_type, который scandir отдаёт без лишних вызовов, поэтому
+        на папку приходится scandir и один lstat каждой подпапки, на файл — один lstat за размером.
+        lstat подпапки даёт сразу и её отпечаток, и устройство: если оно отличается от устройства
+        текущей папки, подпапка — точка монтирования другого раздела и не обходится.
+        lstat файла даёт и размер, и занятое место, и число жёстких ссылок.
+        В режиме Inode order записи сначала сортируются по inode (на POSIX он есть в d_ino),
+        чтобы lstat шли по таблице inode в одну сторону.
         """
         subfolders: list[str] = []
-        files: dict[str, int] = {}
-        current_folder_files_size = 0
-        
-        # Нормализуем текущий путь, чтобы он совпадал с ключом в self.folders
-        normalized_current_path = self._normalize(path)
+        subfolder_signatures: list[Optional[Signature]] = []
+        files: dict[str, tuple[int, int]] = {}
+        links: list[LinkedFile] = []
+        hardlinks = 0
+
+        if signature is None:
+            # Корень или папка из старой бд
+            signature = self._get_signature(path)
+            if signature is not None and parent_device and signature[3] != parent_device:
+                # С прошлого сканирования сюда смонтирован другой раздел
+                self._store_directory(node, path, None, files, subfolders, subfolder_signatures)
+                return
+        if self.incremental and self._reuse_directory(node, path, signature):
+            return
+        device = signature[3] if signature is not None else None
+        ignore_paths = self.ignore_paths
 
         try:
             with os.scandir(path) as it:
-                for entry in it:
+                entries: Iterable[os.DirEntry[str]] = sorted(it, key=os.DirEntry.inode) if self.inode_order else it
+                for entry in entries:
                     if not self.is_running:
                         return
                     try:
-                        # Обработка директорий
+                        # Обработка директорий (символические ссылки сюда не попадают)
                         if entry.is_dir(follow_symlinks=False):
-                            if entry.is_symlink() or os.path.ismount(entry.path):
+                            # На Windows точки монтирования томов — это junction, их видно без вызовов
+                            if entry.is_junction():
                                 continue
-                            
+
                             # Проверка игнорируемых путей
-                            if entry.path.rstrip('/\\') in IGNORE_PATHS:
+                            if ignore_paths and entry.path in ignore_paths:
                                 continue
 
-                            # Важно: нормализуем путь подпапки перед добавлением
-                            child_path = self._normalize(entry.path)
-                            subfolders.append(child_path)
-                            self.queue.put(child_path)
+                            stat = entry.stat(follow_symlinks=False)
+                            # На Windows scandir отдаёт устройство 0: там границы разделов — junction выше
+                            if stat.st_dev and device and stat.st_dev != device:
+                                continue
+
+                            subfolders.append(entry.name)
+                            subfolder_signatures.append((stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, stat.st_dev))
 
                         # Обработка файлов
                         elif entry.is_file(follow_symlinks=False):
-                            # st_size дает реальный размер в байтах
-                            file_size = entry.stat(follow_symlinks=False).st_size
-                            current_folder_files_size += file_size
-                            files[entry.name] = file_size
+                            stat = entry.stat(follow_symlinks=False)
+                            # st_size — видимый размер, st_blocks — занятые блоки по 512 байт (меньше у разреженных файлов)
+                            file_size = stat.st_size
+                            allocated = stat.st_blocks * 512 if HAS_BLOCKS else file_size
+                            if stat.st_nlink > 1:
+                                hardlinks += 1
+                                # На Windows scandir не отдаёт inode (0): повторы там не ищутся
+                                if self.count_hardlinks_once and stat.st_ino:
+                                    links.append((len(files), stat.st_dev, stat.st_ino))
+                            files[entry.name] = (file_size, allocated)
                     
-                    except PermissionError:
+                    except PermissionError as e:
                         logging.warning(f"Недостаточно прав доступа: {entry.path}")
+                        self.stats.count_error(e)
                         continue
                     except Exception as e:
                         logging.error(f"Ошибка при сканировании {entry.path}: {e}")
+                        self.stats.count_error(e)
                         continue
 
-        except PermissionError:
+        except PermissionError as e:
             logging.warning(f"Недостаточно прав доступа: {path}")
+            self.stats.count_error(e)
         except Exception as e:
             logging.error(f"Ошибка при сканировании {path}: {e}")
+            self.stats.count_error(e)
 
-        # Обновляем прогресс-бар
-        if current_folder_files_size > 0:
-            with self.size_calc_lock:
-                self.current += current_folder_files_size
-
-        # Записываем результаты в общий словарь под блокировкой
-        with self.data_lock:
-            if len(files) == 0 and len(subfolders) == 1:
-                self.to_change[normalized_current_path] = subfolders[0]
-            self.folders[normalized_current_path] = {
-                "__files_size__": current_folder_files_size,
-                "used_size": current_folder_files_size,
-                "subfolders": subfolders,
-                "files": files
-            }
+        self._store_directory(node, path, signature, files, subfolders, subfolder_signatures, links, hardlinks)
 
-    def _worker(self) -> None:
-        """Поток-обработчик."""
+    def _worker(self, worker: int) -> None:
+        """Поток-обработчик. Работает, пока в очереди есть незавершённые папки."""
+        self._local.worker = worker
         while True:
             if not self.is_running:
-                self.queue.shutdown(immediate=True)
+                self.queue.close()
                 break
-            try:
-                path = self.queue.get()
-            except ShutDown:
+            item = self.queue.get(worker)
+            if item is None:
                 break
-            if path is None: # Сигнал остановки
+            try:
+                self._process_directory(*item)
+            finally:
                 self.queue.task_done()
+
+    def _scan_with_threads(self, start: Optional[list[DirectoryItem]] = None) -> None:
+        """
+        Обходит дерево потоками, у каждого своя дека задач (см. WorkStealingQueue).
+        В режиме Inode order потоки берут папки из общей очереди по возрастанию inode (см. InodeOrderQueue).
+        """
+        if self.inode_order:
+            # Корень и подпапки папок из старой бд идут без отпечатка: им ключ 0
+            self.queue = InodeOrderQueue(lambda item: item[3][2] if item[3] is not None else 0)
+        else:
+            # При автоподборе деки заводятся на максимум потоков, а сами потоки запускаются по мере надобности
+            self.queue = WorkStealingQueue(AUTO_MAX_THREADS if self.auto_threads else self.num_threads)
+        self._threads = []
+
+        # Добавляем начальную точку (корень таблицы)
+        self.queue.push(0, start or [(0, self._normalize(self.starting_point), None, None)])
+        self._start_workers(self.num_threads)
+
+        stop = threading.Event()
+        tuner = threading.Thread(target=self._tune_loop, args=(stop,), daemon=True)
+        if self.auto_threads:
+            tuner.start()
+
+        # Потоки сами завершаются, когда незавершённых папок не остаётся.
+        # Подборщик может добавить потоки во время ожидания, поэтому список проверяется заново
+        joined = 0
+        while joined < len(self._threads):
+            self._threads[joined].join()
+            joined += 1
+        stop.set()
+        if self.auto_threads:
+            tuner.join()
+        for t in self._threads[joined:]:
+            t.join()
+
+    def _start_workers(self, count: int) -> None:
+        '''Доводит число запущенных потоков до count и оставляет работать первые count из них'''
+        for worker in range(len(self._threads), count):
+            t = threading.Thread(target=self._worker, args=(worker,))
+            t.start()
+            self._threads.append(t)
+        self.queue.set_active(count)
+        self.num_threads = count
+
+    def _tune_loop(self, stop: threading.Event) -> None:
+        '''
+        Первые секунды сканирования подбирает число потоков по скорости обхода (см. ThreadTuner)
+        '''
+        tuner = ThreadTuner(self.num_threads)
+        directories, last_time = self.stats.directories, time.perf_counter()
+        while not tuner.is_finished and not stop.wait(TUNE_STEP_SECONDS):
+            now = time.perf_counter()
+            current = self.stats.directories
+            threads = tuner.update((current - directories) / max(now - last_time, 1e-9))
+            directories, last_time = current, now
+            if threads != self.num_threads and self.is_running:
+                self._start_workers(threads)
+        self.stats.tuning = tuner.history
+        if not tuner.history:
+            # Обход закончился раньше первого замера: начальное число ничем не подтверждено
+            logging.info(f'Потоки не подобраны: обход короче {TUNE_STEP_SECONDS} с')
+            return
+        self.tuned_threads = tuner.best
+        logging.info(f'Подобрано потоков: {tuner.best}. Замеры (потоков, папок/с): {tuner.history}')
+
+    def _split_frontier(self) -> list[DirectoryItem]:
+        """
+        Обходит верхние уровни дерева в текущем процессе, пока не наберётся
+        достаточно поддеревьев, чтобы загрузить все процессы.
+        """
+        self.queue = WorkStealingQueue(1)
+        frontier: list[DirectoryItem] = [(0, self._normalize(self.starting_point), None, None)]
+        target = self.num_processes * SUBTREES_PER_PROCESS
+        for _ in range(FRONTIER_MAX_DEPTH):
+            if len(frontier) >= target:
                 break
-            
-            self._process_directory(path)
-            self.queue.task_done()
+            next_frontier: list[DirectoryItem] = []
+            for item in frontier:
+                if not self.is_running:
+                    return []
+                self._process_directory(*item)
+                next_frontier.extend(self.queue.drain())
+            frontier = next_frontier
+        return frontier
+
+    def _scan_with_processes(self) -> None:
+        """
+        Раздаёт поддеревья пулу процессов и приживляет их таблицы к общей.
+        """
+        frontier = self._split_frontier()
+        if not frontier:
+            return
+        logging.info(f'Поддеревьев для процессов: {len(frontier)}. Количество процессов: {self.num_processes}')
+
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        progress = context.Array('q', 3)
+        base_progress = self.current
+        base_directories, base_files = self.stats.directories, self.stats.files
+
+        with ProcessPoolExecutor(
+                max_workers=self.num_processes,
+                mp_context=context,
+                initializer=_init_process_worker,
+                initargs=(stop_event, progress)
+            ) as executor:
+            nodes: dict[Future[tuple[NodeTable, int, dict[str, Any], array[int]]], int] = {
+                executor.submit(_scan_subtree, item[1:], self.database.path, self.incremental, self.ignore_paths, self.count_hardlinks_once): item[0]
+                for item in frontier
+            }
+            pending = set(nodes)
+            while pending:
+                done, pending = wait(pending, timeout=0.1)
+                self.pending_subtrees = len(pending)
+                self.current = base_progress + progress[PROGRESS_BYTES]
+                self.stats.bytes = self.current
+                self.stats.directories = base_directories + progress[PROGRESS_DIRECTORIES]
+                self.stats.files = base_files + progress[PROGRESS_FILES]
+                if not self.is_running:
+                    stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    try:
+                        table, reused, totals, links = future.result()
+                    except Exception as e:
+                        logging.error(f'Ошибка в процессе сканирования: {e}')
+                        self.stats.count_error(e)
+                        continue
+                    base = self.table.graft(nodes[future], table)
+                    self._merge_links(base, links)
+                    self.reused += reused
+                    self.stats.merge(totals)
+
+    def _merge_links(self, base: int, links: array[int]) -> None:
+        '''
+        Добавляет файлы с жёсткими ссылками из поддерева, просканированного другим процессом.
+        base — сдвиг индексов поддерева (см. NodeTable.graft)
+        '''
+        for i in range(0, len(links), 3):
+            links[i] += base
+        with self.data_lock:
+            room = self._links_room()
+            # Поддерево, упёршееся в тот же предел, тоже записало не все файлы
+            if len(links) // 3 >= room:
+                self.links_overflow = True
+            self.linked_files.extend(links[:room * 3])
+
+    def _links_room(self) -> int:
+        '''Сколько ещё файлов с жёсткими ссылками можно записать в linked_files'''
+        return max(self.inodes.max_items - len(self.linked_files) // 3, 0)
+
+    def _count_links_once(self) -> None:
+        '''
+        Оставляет размер каждого файла с несколькими жёсткими ссылками только у ссылки
+        с наименьшим путём, остальные обнуляет (NodeTable.discount). Выбор не зависит
+        от порядка обхода, поэтому при любом бэкенде и числе потоков посчитана одна и та же ссылка.
+        Исключение — файлы сверх InodeSet.max_items: они посчитаны столько раз, сколько найдены
+        '''
+        if self.links_overflow:
+            logging.warning(f'Файлов с жёсткими ссылками больше {self.inodes.max_items}: часть повторов посчитана, и какие — зависит от порядка обхода')
+        links, inodes, table = self.linked_files, self.inodes, self.table
+        discounted = 0
+        for i in range(0, len(links), 3):
+            node, device, inode = links[i], links[i + 1], links[i + 2]
+            counted = inodes.setdefault(device, inode, node)
+            if counted == node:
+                continue
+            # Повтор: размер остаётся у ссылки с меньшим путём
+            if table.path(node) < table.path(counted):
+                inodes.set(device, inode, node)
+                node, counted = counted, node
+            table.discount(node)
+            discounted += 1
+        if discounted:
+            logging.info(f'Повторных жёстких ссылок: {discounted}')
 
     def _aggregate_sizes(self) -> None:
         """
-        Считает полные размеры папок снизу вверх.
+        Проверяет, что полные размеры папок подсчитаны.
+        Обычно они уже собраны во время обхода (NodeTable поднимает размер папки
+        к родителю, как только она завершена), и здесь ничего не делается.
+        Перед этим снимаются повторные жёсткие ссылки (см. _count_links_once).
         """
-        # Сортируем пути по длине строки (от длинных к коротким).
-        # Самые длинные пути — это самые глубокие папки.
-        # Мы гарантированно обработаем детей до их родителей.
-        sorted_paths = sorted(
-            self.folders.keys(), 
-            key=len, 
-            reverse=True
-        )
-
-        for path in sorted_paths:
-            if path == '__root__':
-                continue
-            folder_data = self.folders[path]
-            
-            total_size = folder_data["__files_size__"]
-            
-            for subpath in folder_data["subfolders"]:
-                # Ищем подпапку в уже обработанных данных
-                if subpath in self.folders:
-                    total_size += self.folders[subpath]["used_size"]
-                else:
-                    # Если подпапки нет в ключах (например, ошибка доступа при сканировании),
-                    # мы просто игнорируем её размер, так как он равен 0 или неизвестен.
-                    pass
-
-            folder_data["used_size"] = total_size
-            
-            # Удаляем временное поле, чтобы не засорять JSON
-            del folder_data["__files_size__"]
+        self._count_links_once()
+        table = self.table
+        if table.is_complete(0):
+            return
+
+        # Часть папок не завершилась (например, упал процесс сканирования поддерева):
+        # пересчитываем всё одним проходом от конца к началу, дети лежат после родителей.
+        logging.warning('Не все папки завершены при обходе, размеры пересчитываются заново')
+        total_size, own_size, parent, flags = table.total_size, table.own_size, table.parent, table.flags
+        total_allocated, own_allocated = table.total_allocated, table.own_allocated
+        for node in range(len(table)):
+            if flags[node] & IS_DIR:
+                total_size[node] = own_size[node]
+                total_allocated[node] = own_allocated[node]
+        for node in range(len(table) - 1, 0, -1):
+            if flags[node] & IS_DIR:
+                total_size[parent[node]] += total_size[node]
+                total_allocated[parent[node]] += total_allocated[node]
 
     def _collapse_folders(self) -> None:
         '''
         Объединяет папки, которые содержат только 1 подпапку
         И удаляет из данных пустые папки (папки, весящие 0 байт)
+
+        Один проход от детей к родителям: для каждой папки в self.collapse_to
+        записывается конец её цепочки (сама папка, если она не сворачивается)
+        или -1, если папка пустая. Конец цепочки ребёнка уже известен,
+        поэтому цепочки любой длины разрешаются за O(1) на папку.
         '''
-        to_change = set(sorted(self.to_change))
-        to_remove: set[str] = set()
-        for path in self.folders:
-            if path == '__root__':
+        table = self.table
+        first_child, next_sibling, total_size, flags = table.first_child, table.next_sibling, table.total_size, table.flags
+        collapse_to = array('i', range(len(table)))
+        for node in range(len(table) - 1, -1, -1):
+            if not flags[node] & IS_DIR:
                 continue
-            if self.folders[path]["used_size"] == 0:
-                to_remove.add(path)
-            i = 0
-            while i < len(self.folders[path]["subfolders"]):
-                subfolder = self.folders[path]["subfolders"][i]
-                if subfolder in to_change:
-                    self.folders[path]["subfolders"].remove(subfolder)
-                    self.folders[path]["subfolders"].append(self.to_change[subfolder])
-                else:
-                    i += 1
-        for path in to_change | to_remove:
-            if path in self.folders:
-                del self.folders[path]
-        for path in self.folders:
-            if path == '__root__':
+            if total_size[node] == 0:
+                collapse_to[node] = -1
                 continue
-            i = 0
-            while i < len(self.folders[path]["subfolders"]):
-                subfolder = self.folders[path]["subfolders"][i]
-                if subfolder in to_remove:
-                    self.folders[path]["subfolders"].remove(subfolder)
-                else:
-                    i += 1
-
-    def _form_final_data(self) -> dict[str, dict[str, Any]]:
+            child = first_child[node]
+            # Подпапки в блоке идут первыми, поэтому «ни одного файла и одна подпапка» —
+            # это единственный ребёнок, и он папка
+            if child != -1 and next_sibling[child] == -1 and flags[child] & IS_DIR:
+                collapse_to[node] = collapse_to[child]
+        self.collapse_to = collapse_to
+
+    def _iter_records(self, search_index: SearchIndexBuilder) -> Iterator[FolderRecord]:
         '''
-        Предобрабатывает данные в формат, который использует визуализатор
+        Перебирает записи папок в формате, который использует визуализатор (ещё не сериализованные).
+        Попутно заполняет поисковый индекс всем, что попадает в записи
         '''
-        data: dict[str, Any] = {}
-        for path in self.folders.keys():
-            if path == '__root__':
+        table = self.table
+        collapse_to = self.collapse_to
+        # Номер папки в поисковом индексе: {индекс узла: номер элемента}
+        entries: dict[int, int] = {0: 0}
+        # Пути папок собираются от корня вниз: родитель всегда обработан раньше ребёнка.
+        # Хранятся только пути папок, у которых ещё остались необработанные подпапки
+        paths: dict[int, str] = {}
+        for node in range(len(table)):
+            if not table.is_dir(node):
                 continue
-            path = self._normalize(path)
-            data[path] = {
-                'subfolders': [],
-                'files': [],
-                's': self.folders[path]['used_size']
-            }
-            for subfolder in self.folders[path]['subfolders']:
-                data[path]['subfolders'].append({
-                    'p': subfolder,
-                    'n': subfolder[len(path):].lstrip(os.sep) if subfolder.startswith(path) else os.path.basename(subfolder),
-                    's': self.folders[subfolder]['used_size']
-                })
-            for filename, size in self.folders[path]['files'].items():
-                data[path]['files'].append({
-                    'p': os.path.join(path, filename),
-                    'n': filename,
-                    's': size
+            if node == 0:
+                path = self._normalize(table.name(node))
+            else:
+                parent = table.parent[node]
+                path = os.path.join(paths[parent], table.name(node))
+                # Последняя подпапка родителя: его путь больше не понадобится
+                sibling = table.next_sibling[node]
+                if sibling == -1 or not table.is_dir(sibling):
+                    del paths[parent]
+            paths[node] = path
+            if node != 0 and collapse_to[node] != node:
+                continue
+            entry = entries.pop(node)
+
+            subfolders: list[dict[str, Any]] = []
+            files: list[dict[str, Any]] = []
+            children: list[str] = []
+            for child in table.children(node):
+                name = table.name(child)
+                if not table.is_dir(child):
+                    files.append({
+                        'p': os.path.join(path, name),
+                        'n': name,
+                        's': table.own_size[child],
+                        'a': table.own_allocated[child]
+                    })
+                    search_index.add(entry, name)
+                    continue
+                children.append(name)
+                target = collapse_to[child]
+                if target == -1:
+                    continue
+                if target != child:
+                    # Цепочку папок с единственной подпапкой заменяем её концом
+                    parts: list[str] = []
+                    link = target
+                    while link != child:
+                        parts.append(table.name(link))
+                        link = table.parent[link]
+                    name = os.path.join(name, *reversed(parts))
+                subfolders.append({
+                    'p': os.path.join(path, name),
+                    'n': name,
+                    's': table.total_size[target],
+                    'a': table.total_allocated[target]
                 })
-            data[path]['subfolders'].sort(key=lambda x: x['s'], reverse=True) # type: ignore
-            data[path]['files'].sort(key=lambda x: x['s'], reverse=True) # type: ignore
+                entries[target] = search_index.add(entry, name)
+            yield (
+                path, subfolders, files, table.total_size[node], table.total_allocated[node],
+                table.signatures.get(node), children, table.hardlinks.get(node, 0)
+            )
 
-            data[path]['subfolders'] = compression.zstd.compress(pickle.dumps(data[path]['subfolders']))
-            data[path]['files'] = compression.zstd.compress(pickle.dumps(data[path]['files']))
-
-        data['__root__'] = self.folders['__root__']['path']
-        data['__date__'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return data
+    def _iter_batches(self, search_index: SearchIndexBuilder) -> Iterator[list[FolderRecord]]:
+        '''
+        Собирает записи в пачки примерно по WRITE_BATCH_ENTRIES элементов
+        '''
+        batch: list[FolderRecord] = []
+        entries = 0
+        for record in self._iter_records(search_index):
+            batch.append(record)
+            entries += len(record[1]) + len(record[2]) + 1
+            if entries >= WRITE_BATCH_ENTRIES:
+                yield batch
+                batch = []
+                entries = 0
+        if batch:
+            yield batch
+
+    def _write_database(self) -> int:
+        '''
+        Пишет записи папок сразу в бд, не собирая их в общий словарь.
+        Сортировка, pickle и сжатие идут пачками в пуле потоков, в памяти держится
+        не больше двух пачек на поток. Возвращает число записанных папок.
+        '''
+        count = 0
+        search_index = SearchIndexBuilder(self._normalize(self.table.name(0)))
+        # Работа здесь упирается в процессор, а не в диск: больше потоков, чем ядер, не нужно
+        num_workers = min(self.num_threads, os.cpu_count() or 1)
+        max_in_flight = num_workers * 2
+        with self.database.writer() as writer, ThreadPoolExecutor(num_workers) as executor:
+            in_flight: deque[Future[list[tuple[str, bytes]]]] = deque()
+
+            def write_oldest() -> None:
+                nonlocal count
+                start = time.perf_counter()
+                batch = in_flight.popleft().result()
+                middle = time.perf_counter()
+                for key, data_bytes in batch:
+                    writer.add_raw(key, data_bytes)
+                self.stats.add_time('wait_encode', middle - start)
+                self.stats.add_time('write', time.perf_counter() - middle)
+                count += len(batch)
+
+            for records in self._iter_batches(search_index):
+                in_flight.append(executor.submit(self._timed, 'encode', _encode_records, records))
+                if len(in_flight) >= max_in_flight:
+                    write_oldest()
+            while in_flight:
+                write_oldest()
+
+            start = time.perf_counter()
+            search_index.write(writer)
+            self.stats.add_time('search_index', time.perf_counter() - start)
+            logging.info(f'Поисковый индекс сформирован. Элементов: {len(search_index)}')
+
+            writer.add('__root__', self._normalize(self.table.name(0)))
+            # Подобранное число потоков нужно следующему сканированию, явно заданное его не меняет
+            threads = self.tuned_threads or self.stored_threads
+            if threads:
+                writer.add(THREADS_KEY, threads)
+            writer.add('__date__', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        return count
+
+    def _timed[T](self, name: str, function: Callable[..., T], *args: Any) -> T:
+        '''Вызывает function и прибавляет время вызова к счётчику name'''
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.stats.add_time(name, time.perf_counter() - start)
 
-    def run(self) -> bool:
+    def sample_stats(self) -> dict[str, Any]:
+        '''
+        Снимает показания счётчиков (см. ScanStats.sample). Последние показания
+        лежат в self.stats.last_sample, их можно читать из любого потока
+        '''
+        queue_depth = self.pending_subtrees if self.backend == 'Processes' else self.queue.qsize()
+        return self.stats.sample(queue_depth, self.table.lock_wait, self.num_threads)
+
+    def _sample_loop(self, stop: threading.Event) -> None:
+        while not stop.wait(SAMPLE_INTERVAL):
+            self.sample_stats()
+
+    def trace_path(self) -> str:
+        '''Файл трассировки сканирования: рядом с бд'''
+        return os.path.splitext(self.database.path)[0] + '.trace.json'
+
+    def _write_trace(self, is_completed: bool) -> None:
+        self.stats.write_trace(self.trace_path(), {
+            'path': self.starting_point,
+            'backend': self.backend,
+            'num_threads': self.num_threads,
+            'auto_threads': self.auto_threads,
+            'stored_threads': self.stored_threads,
+            'num_processes': self.num_processes if self.backend == 'Processes' else None,
+            'incremental': self.incremental,
+            'reused': self.reused,
+            'count_hardlinks_once': self.count_hardlinks_once,
+            'hardlinked_files': len(self.inodes)
+        }, self.table.lock_wait, is_completed)
+
+    def _prepare(self) -> None:
+        """
+        Сбрасывает состояние перед новым обходом.
+        """
         self.is_running = True
-        logging.info(f'Начало сканирования {self.starting_point}')
         if not is_root(self.starting_point):
             # Если текущая директория не корень системы, то определить заранее размер нельзя
             total_usage = 0
@@ -242,57 +739,182 @@ class SizeFinder:
             # Получаем общий размер диска для прогресс-бара в UI
             total_usage = get_used_disk_size(self.starting_point)
 
-        self.folders = {
-            '__root__': {'path': self._normalize(self.starting_point)}
-        }
-        self.queue = Queue()
-        
-        # Добавляем начальную точку (нормализованную)
-        self.queue.put(self._normalize(self.starting_point))
-
+        self.table = NodeTable()
+        self.table.add_root(self._normalize(self.starting_point))
+        self.collapse_to = array('i')
         self.total = total_usage
         self.current = 0
+        self.reused = 0
+        self.linked_files = array('Q')
+        self.links_overflow = False
+        self.inodes = InodeSet()
+
+        if self.incremental and not self.database.is_open:
+            self.database.open()
+        self.tuned_threads = None
+        self.stored_threads = self._load_stored_threads()
+        if self.auto_threads and self.stored_threads:
+            self.num_threads = self.stored_threads
+            logging.info(f'Начальное число потоков из прошлого сканирования: {self.num_threads}')
 
         gc.disable() # Отключаем GC для скорости при создании миллионов объектов
 
-        threads: list[threading.Thread] = []
-        # Запуск потоков
-        for _ in range(self.num_threads):
-            t = threading.Thread(target=self._worker)
-            t.start()
-            threads.append(t)
+    def _load_stored_threads(self) -> Optional[int]:
+        '''
+        Число потоков, подобранное при прошлом сканировании этого корня (None, если его нет).
+        Бд открывается только ради автоподбора; при явном числе потоков значение читается,
+        только если бд уже открыта (инкрементальный режим), чтобы сохранить его при записи.
+        Чтение необязательное: пустой, повреждённый или записанный другой версией файл
+        сканирование просто перезапишет
+        '''
+        try:
+            if not self.database.is_open:
+                if not self.auto_threads:
+                    return None
+                self.database.open()
+            threads = self.database.get(THREADS_KEY)
+        except Exception as e:
+            logging.warning(f'Не удалось прочитать число потоков из {self.database.path}: {e}')
+            return None
+        if isinstance(threads, int) and 0 < threads <= AUTO_MAX_THREADS:
+            return threads
+        return None
 
-        # Блокируем главный поток, пока очередь не опустеет
-        self.queue.join()
+    def _scan(self) -> None:
+        """
+        Обход дерева выбранным бэкендом. Пока он идёт, раз в SAMPLE_INTERVAL снимаются показания счётчиков.
+        """
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample_loop, args=(stop,), daemon=True)
+        sampler.start()
+        try:
+            if self.backend == 'Processes':
+                self._scan_with_processes()
+            else:
+                self._scan_with_threads()
+        finally:
+            stop.set()
+            sampler.join()
+            self.sample_stats()
 
-        # Останавливаем потоки
-        for _ in range(self.num_threads):
-            self.queue.put(None)
-        for t in threads:
-            t.join()
+    def run(self) -> bool:
+        logging.info(f'Начало сканирования {self.starting_point}')
+        self.stats = ScanStats()
+        with self.stats.phase('prepare'):
+            self._prepare()
+        with self.stats.phase('scan'):
+            self._scan()
 
         if not self.is_running:
             logging.info('Сканирование прервано')
+            gc.enable()
+            self._write_trace(False)
             return False
 
-        logging.info(f'Сканирование {self.starting_point} завершено. Получено {len(self.folders)-1} папок. Данные о корне: {self.folders["__root__"]} | {self.folders[self.folders["__root__"]['path']]}')
+        if self.incremental:
+            logging.info(f'Из предыдущей базы взято {self.reused} неизменённых папок')
+
+        logging.info(f'Сканирование {self.starting_point} завершено. Получено {len(self.table)} записей')
         
-        self._aggregate_sizes()
+        with self.stats.phase('aggregate_sizes'):
+            self._aggregate_sizes()
 
-        logging.info(f'Размеры папок подсчитаны. Данные о корне: {self.folders["__root__"]} | {self.folders[self.folders["__root__"]['path']]}')
+        logging.info(f'Размеры папок подсчитаны. Размер корня: {self.table.total_size[0]}')
 
-        self._collapse_folders()
+        with self.stats.phase('collapse_folders'):
+            self._collapse_folders()
 
-        logging.info(f'Коллапс папок завершён. Получено {len(self.folders)-1} папок')
+        logging.info(f'Коллапс папок завершён. Свёрнуто {sum(1 for node, target in enumerate(self.collapse_to) if target not in (node, -1))} папок, удалено {self.collapse_to.count(-1)} пустых папок')
 
-        data = self._form_final_data()
+        with self.stats.phase('write_database'):
+            count = self._write_database()
 
-        logging.info(f'Конечный данные сформированы. Получено {len(self.folders)-1} папок. Данные о корне: {self.folders["__root__"]} | {self.folders[self.folders["__root__"]['path']]}')
-        
         gc.enable()
+        self._write_trace(True)
 
-        self.database.create_db(data)
-
+        logging.info(f'Конечный данные сформированы. Записано {count} папок')
         logging.info(f'Сканирование {self.starting_point} завершено. Данные успешно сохранены')
         
         return True
+
+
+def _encode_records(records: list[FolderRecord]) -> list[tuple[str, bytes]]:
+    '''
+    Сериализует пачку записей папок в байты для Database.
+    Выполняется в пуле потоков: сжатие отпускает GIL
+    '''
+    encoded: list[tuple[str, bytes]] = []
+    for path, subfolders, files, size, allocated, signature, children, hardlinks in records:
+        subfolders.sort(key=lambda x: x['s'], reverse=True) # type: ignore
+        files.sort(key=lambda x: x['s'], reverse=True) # type: ignore
+        encoded.append((path, marshal.dumps({
+            'subfolders': compression.zstd.compress(pickle.dumps(subfolders)),
+            'files': compression.zstd.compress(pickle.dumps(files)),
+            's': size,
+            'a': allocated,
+            # Отпечаток и все прямые подпапки нужны для инкрементального сканирования
+            'm': signature,
+            'd': compression.zstd.compress(pickle.dumps(children)),
+            'h': hardlinks
+        })))
+    return encoded
+
+
+_stop_event: Optional[Event] = None
+_progress: Optional[SynchronizedArray] = None # pyright: ignore[reportMissingTypeArgument]
+
+
+def _init_process_worker(stop_event: Event, progress: SynchronizedArray) -> None: # pyright: ignore[reportMissingTypeArgument]
+    global _stop_event, _progress
+    _stop_event = stop_event
+    _progress = progress
+
+
+def _scan_subtree(
+        item: tuple[str, Optional[int], Optional[Signature]],
+        database_path: str,
+        incremental: bool,
+        ignore_paths: set[str],
+        count_hardlinks_once: bool
+    ) -> tuple[NodeTable, int, dict[str, Any], array[int]]:
+    """
+    Сканирует одно поддерево в дочернем процессе. item — (путь, устройство родителя, отпечаток).
+    Возвращает таблицу поддерева (до подсчёта размеров): её массивы передаются одним куском,
+    число взятых из старой бд папок, итоги счётчиков (ScanStats.totals)
+    и файлы с жёсткими ссылками (см. SizeFinder._merge_links).
+    """
+    path = item[0]
+    database = Database(database_path)
+    if incremental:
+        database.open()
+    finder = SizeFinder(database, path, PROCESS_WORKER_THREADS, incremental, ignore_paths=ignore_paths, count_hardlinks_once=count_hardlinks_once)
+    finder.is_running = True
+    finder.table.add_root(path)
+
+    is_finished = False
+
+    def watch() -> None:
+        # Пробрасывает прогресс в главный процесс и следит за сигналом остановки
+        reported = [0, 0, 0]
+        while True:
+            if _stop_event is not None and _stop_event.is_set():
+                finder.is_running = False
+            current = [finder.current, finder.stats.directories, finder.stats.files]
+            if _progress is not None and current != reported:
+                with _progress.get_lock():
+                    for cell in (PROGRESS_BYTES, PROGRESS_DIRECTORIES, PROGRESS_FILES):
+                        _progress[cell] += current[cell] - reported[cell]
+                reported = current
+            if is_finished:
+                break
+            time.sleep(0.1)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        finder._scan_with_threads([(0, *item)]) # pyright: ignore[reportPrivateUsage]
+    finally:
+        is_finished = True
+        watcher.join()
+        database.close()
+    return finder.table, finder.reused, finder.stats.totals(finder.table.lock_wait), finder.linked_files
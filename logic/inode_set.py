@@ -0,0 +1,99 @@
+import threading
+from array import array
+from typing import Optional
+
+
+# Начальное число ячеек (степень двойки)
+INITIAL_SLOTS = 1024
+# Больше этого числа элементов множество не растёт: дальше файлы считаются без проверки повторов.
+# При заполнении не больше половины ячеек это до 192 МБ
+MAX_ITEMS = 1 << 22
+# Множитель для перемешивания номера inode (золотое сечение, 64 бита)
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class InodeSet:
+    '''
+    Множество пар (устройство, inode) с открытой адресацией на массивах 'Q'; у каждой пары
+    есть значение (номер узла, у которого файл посчитан). Занимает 24 байта на ячейку
+    вместо ~150 байт на кортеж в обычном dict, поэтому в нём можно держать
+    все файлы с несколькими жёсткими ссылками.
+    Пара (0, 0) означает пустую ячейку и отдельно хранится флагом.
+
+    Размер ограничен max_items: после него новые пары не добавляются (файл считается),
+    а is_full показывает, что часть повторов могла быть посчитана.
+    '''
+    def __init__(self, max_items: int = MAX_ITEMS) -> None:
+        self.max_items = max_items
+        self.devices = array('Q', bytes(8 * INITIAL_SLOTS))
+        self.inodes = array('Q', bytes(8 * INITIAL_SLOTS))
+        self.values = array('Q', bytes(8 * INITIAL_SLOTS))
+        self.count = 0
+        self.is_full = False
+        self._zero_value: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count + (self._zero_value is not None)
+
+    def _slot(self, device: int, inode: int) -> int:
+        '''Ячейка с этой парой или пустая ячейка, куда её нужно положить'''
+        devices, inodes = self.devices, self.inodes
+        mask = len(inodes) - 1
+        slot = ((inode * _MIX & _MASK64) >> 20 ^ device) & mask
+        while True:
+            stored = inodes[slot]
+            if stored == inode and devices[slot] == device:
+                return slot
+            if stored == 0 and devices[slot] == 0:
+                return slot
+            slot = (slot + 1) & mask
+
+    def setdefault(self, device: int, inode: int, value: int) -> int:
+        '''
+        Значение пары. Если её не было, добавляет пару со значением value и возвращает value
+        (так же, если множество заполнено и пара не добавлена)
+        '''
+        with self._lock:
+            if not device and not inode:
+                if self._zero_value is None:
+                    self._zero_value = value
+                return self._zero_value
+            slot = self._slot(device, inode)
+            if self.inodes[slot] or self.devices[slot]:
+                return self.values[slot]
+            if self.count >= self.max_items:
+                self.is_full = True
+                return value
+            self.devices[slot] = device
+            self.inodes[slot] = inode
+            self.values[slot] = value
+            self.count += 1
+            if self.count * 2 > len(self.inodes):
+                self._grow()
+            return value
+
+    def set(self, device: int, inode: int, value: int) -> None:
+        '''Заменяет значение уже добавленной пары'''
+        with self._lock:
+            if not device and not inode:
+                self._zero_value = value
+                return
+            slot = self._slot(device, inode)
+            if self.inodes[slot] or self.devices[slot]:
+                self.values[slot] = value
+
+    def _grow(self) -> None:
+        '''Удваивает число ячеек. Вызывается под self._lock'''
+        devices, inodes, values = self.devices, self.inodes, self.values
+        size = len(inodes) * 2
+        self.devices = array('Q', bytes(8 * size))
+        self.inodes = array('Q', bytes(8 * size))
+        self.values = array('Q', bytes(8 * size))
+        for device, inode, value in zip(devices, inodes, values):
+            if device or inode:
+                slot = self._slot(device, inode)
+                self.devices[slot] = device
+                self.inodes[slot] = inode
+                self.values[slot] = value
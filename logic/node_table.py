@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+from array import array
+from itertools import accumulate
+from typing import Any, Iterator
+
+
+# Флаги узла
+IS_DIR = 1
+# Содержимое папки уже записано в таблицу
+LISTED = 2
+
+
+class NodeTable:
+    '''
+    Колоночное хранилище дерева файлов.
+    Каждая папка и каждый файл — индекс в параллельных массивах, имена лежат подряд
+    в общем байтовом буфере, а полные пути собираются только по запросу.
+    Дети всегда добавляются после родителя, поэтому индекс ребёнка больше индекса родителя.
+
+    Размеры считаются по ходу обхода: когда папка и все её подпапки просканированы,
+    её полный размер сразу прибавляется к родителю.
+    Каждый размер хранится дважды: видимый (st_size) и занятый на диске (st_blocks * 512).
+    '''
+    def __init__(self) -> None:
+        self.parent = array('i')
+        self.name_offset = array('Q')
+        self.name_length = array('H')
+        # Для папки — сумма размеров её собственных файлов, для файла — его размер
+        self.own_size = array('Q')
+        # Для папки — размер вместе с уже завершёнными подпапками
+        self.total_size = array('Q')
+        # То же для места, занятого на диске
+        self.own_allocated = array('Q')
+        self.total_allocated = array('Q')
+        # Для папки — сколько подпапок ещё не завершено
+        self.pending = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.flags = bytearray()
+        self.names = bytearray()
+        # Отпечатки папок для инкрементального сканирования: {индекс: (mtime, ctime, inode, устройство)}
+        self.signatures: dict[int, tuple[int, int, int, int]] = {}
+        # Папки, в которых есть файлы с несколькими жёсткими ссылками: {индекс: сколько таких файлов}
+        self.hardlinks: dict[int, int] = {}
+        self.lock = threading.Lock()
+        # Сколько секунд потоки суммарно ждали self.lock в add_children: показатель конкуренции за таблицу
+        self.lock_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def add_root(self, path: str) -> int:
+        '''Добавляет корень. Его имя — полный путь'''
+        return self._append(-1, [os.fsencode(path)], [IS_DIR], [0], [0])
+
+    def add_children(self, parent: int, folders: list[str], files: list[str], sizes: list[int], allocated: list[int]) -> int:
+        '''
+        Добавляет содержимое папки одним блоком: сначала подпапки, затем файлы.
+        Возвращает индекс первой подпапки.
+        '''
+        encoded = [os.fsencode(name) for name in folders]
+        encoded += [os.fsencode(name) for name in files]
+        flags = [IS_DIR] * len(folders) + [0] * len(files)
+        own_size = sum(sizes)
+        own_allocated = sum(allocated)
+        empty = [0] * len(folders)
+        wait_start = time.perf_counter()
+        with self.lock:
+            self.lock_wait += time.perf_counter() - wait_start
+            start = self._append(parent, encoded, flags, empty + sizes, empty + allocated)
+            if encoded:
+                self.first_child[parent] = start
+            self.own_size[parent] = own_size
+            self.total_size[parent] = own_size
+            self.own_allocated[parent] = own_allocated
+            self.total_allocated[parent] = own_allocated
+            self.pending[parent] = len(folders)
+            self.flags[parent] |= LISTED
+            if not folders:
+                self._complete(parent)
+        return start
+
+    def _complete(self, node: int) -> None:
+        '''
+        Папка завершена: прибавляет её размер к родителю и поднимается выше,
+        пока родитель тоже оказывается завершён. Вызывается под self.lock.
+        '''
+        parent, total_size, total_allocated, pending, flags = self.parent, self.total_size, self.total_allocated, self.pending, self.flags
+        while parent[node] != -1:
+            up = parent[node]
+            total_size[up] += total_size[node]
+            total_allocated[up] += total_allocated[node]
+            pending[up] -= 1
+            if pending[up] or not flags[up] & LISTED:
+                break
+            node = up
+
+    def is_complete(self, node: int) -> bool:
+        return bool(self.flags[node] & LISTED) and self.pending[node] == 0
+
+    def discount(self, node: int) -> None:
+        '''
+        Обнуляет размеры файла node (он уже посчитан через другую жёсткую ссылку)
+        и вычитает их из его папки и из папок выше, до которых её размер уже дошёл
+        '''
+        with self.lock:
+            size, allocated = self.own_size[node], self.own_allocated[node]
+            self.own_size[node] = self.total_size[node] = 0
+            self.own_allocated[node] = self.total_allocated[node] = 0
+            up = self.parent[node]
+            self.own_size[up] -= size
+            self.own_allocated[up] -= allocated
+            while up != -1:
+                self.total_size[up] -= size
+                self.total_allocated[up] -= allocated
+                # Незавершённая папка ещё не прибавлена к родителю
+                if not self.is_complete(up):
+                    break
+                up = self.parent[up]
+
+    def _append(self, parent: int, encoded: list[bytes], flags: list[int], sizes: list[int], allocated: list[int]) -> int:
+        count = len(encoded)
+        start = len(self.flags)
+        lengths = [len(name) for name in encoded]
+        self.name_offset.extend(list(accumulate(lengths, initial=len(self.names)))[:-1])
+        self.name_length.extend(lengths)
+        self.names += b''.join(encoded)
+        self.parent.extend([parent] * count)
+        self.own_size.extend(sizes)
+        self.total_size.extend(sizes)
+        self.own_allocated.extend(allocated)
+        self.total_allocated.extend(allocated)
+        self.pending.extend([0] * count)
+        self.first_child.extend([-1] * count)
+        self.next_sibling.extend(range(start + 1, start + count))
+        if count:
+            self.next_sibling.append(-1)
+        self.flags.extend(flags)
+        return start
+
+    def is_dir(self, node: int) -> bool:
+        return bool(self.flags[node] & IS_DIR)
+
+    def name(self, node: int) -> str:
+        offset = self.name_offset[node]
+        return os.fsdecode(bytes(self.names[offset:offset + self.name_length[node]]))
+
+    def path(self, node: int) -> str:
+        '''Собирает полный путь, поднимаясь по родителям'''
+        parts: list[str] = []
+        while self.parent[node] != -1:
+            parts.append(self.name(node))
+            node = self.parent[node]
+        return os.path.join(self.name(node), *reversed(parts))
+
+    def children(self, node: int) -> Iterator[int]:
+        child = self.first_child[node]
+        while child != -1:
+            yield child
+            child = self.next_sibling[child]
+
+    def graft(self, node: int, other: 'NodeTable') -> int:
+        '''
+        Приживляет дерево other (просканированное отдельно) на место узла node.
+        Корень other совпадает с node, остальные узлы дописываются в конец таблицы.
+        Поддерево должно быть полностью просканировано: его размер сразу уходит наверх.
+        Возвращает сдвиг индексов: узел index > 0 из other получает индекс base + index.
+        '''
+        base = len(self) - 1
+
+        def remap(index: int) -> int:
+            if index == -1:
+                return -1
+            if index == 0:
+                return node
+            return base + index
+
+        shift = len(self.names)
+        with self.lock:
+            self.names += other.names
+            for index in range(1, len(other)):
+                self.parent.append(remap(other.parent[index]))
+                self.name_offset.append(other.name_offset[index] + shift)
+                self.first_child.append(remap(other.first_child[index]))
+                self.next_sibling.append(remap(other.next_sibling[index]))
+            self.name_length.extend(other.name_length[1:])
+            self.own_size.extend(other.own_size[1:])
+            self.total_size.extend(other.total_size[1:])
+            self.own_allocated.extend(other.own_allocated[1:])
+            self.total_allocated.extend(other.total_allocated[1:])
+            self.pending.extend(other.pending[1:])
+            self.flags.extend(other.flags[1:])
+
+            self.first_child[node] = remap(other.first_child[0])
+            self.own_size[node] = other.own_size[0]
+            self.total_size[node] = other.total_size[0]
+            self.own_allocated[node] = other.own_allocated[0]
+            self.total_allocated[node] = other.total_allocated[0]
+            self.pending[node] = other.pending[0]
+            self.flags[node] = other.flags[0]
+            for index, signature in other.signatures.items():
+                self.signatures[remap(index)] = signature
+            for index, count in other.hardlinks.items():
+                self.hardlinks[remap(index)] = count
+            if self.is_complete(node):
+                self._complete(node)
+        return base
@@ -0,0 +1,113 @@
+import pickle
+import threading
+import compression.zstd
+from collections import OrderedDict
+from typing import Any
+
+from logic.database import Database
+
+
+# Распакованный список занимает в памяти в несколько раз больше, чем его pickle
+OBJECT_OVERHEAD = 4
+# Поля размера в записях: видимый размер и место на диске
+SIZE_FIELDS = ('s', 'a')
+
+
+class RecordCache:
+    '''
+    LRU-кэш распакованных записей папок (списки subfolders и files) поверх Database.
+    Размер записи оценивается по длине распакованного pickle, при превышении max_bytes
+    вытесняются давно не использованные записи.
+    Возвращаемые списки общие для всех читателей: их нельзя изменять.
+
+    size_field выбирает, какой размер отдаётся в 's': при 'a' элементы списков копируются
+    с местом на диске в 's', поэтому пайплайны отрисовки не знают о выбранном размере.
+    В бд старой версии места на диске нет, тогда остаётся размер.
+    '''
+    def __init__(self, database: Database, max_bytes: int, size_field: str = 's'):
+        self.database = database
+        self.max_bytes = max_bytes
+        self.size_field = size_field if size_field in SIZE_FIELDS else 's'
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # {(путь, поле, поле размера): (список, оценка размера)}
+        self._entries: OrderedDict[tuple[str, str, str], tuple[list[dict[str, Any]], int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.database
+
+    def size(self, path: str) -> int:
+        '''Полный размер папки'''
+        record = self.database[path]
+        return record.get(self.size_field, record['s'])
+
+    def set_size_field(self, size_field: str) -> None:
+        '''Переключает размер ('s' или 'a'). Записи с другим размером больше не нужны'''
+        self.size_field = size_field if size_field in SIZE_FIELDS else 's'
+        self.clear()
+
+    def subfolders(self, path: str) -> list[dict[str, Any]]:
+        return self._get(path, 'subfolders')
+
+    def files(self, path: str) -> list[dict[str, Any]]:
+        return self._get(path, 'files')
+
+    def _get(self, path: str, field: str) -> list[dict[str, Any]]:
+        size_field = self.size_field
+        # Поле размера входит в ключ: отрисовка могла начаться до переключения
+        key = (path, field, size_field)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Распаковка идёт без блокировки: другие потоки в это время читают кэш
+        raw = compression.zstd.decompress(self.database[path][field])
+        value: list[dict[str, Any]] = pickle.loads(raw)
+        if size_field != 's':
+            value = [{**item, 's': item.get(size_field, item['s'])} for item in value]
+        cost = len(raw) * OBJECT_OVERHEAD
+        if cost > self.max_bytes:
+            return value
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, cost)
+                self.current_bytes += cost
+                self._evict()
+        return value
+
+    def _evict(self) -> None:
+        '''Вытесняет старые записи, пока кэш больше лимита. Вызывается под self._lock'''
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, cost) = self._entries.popitem(last=False)
+            self.current_bytes -= cost
+            self.evictions += 1
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
@@ -0,0 +1,138 @@
+import json
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterator, Optional
+
+
+# Как часто сканер снимает показания счётчиков, секунд
+SAMPLE_INTERVAL = 1.0
+# Сколько показаний попадает в файл трассировки (старые прореживаются вдвое)
+MAX_SAMPLES = 1024
+
+
+class ScanStats:
+    '''
+    Счётчики одного сканирования: папки, файлы, байты, ошибки по типам, ожидание блокировок,
+    длительности фаз и накопленное время шагов записи бд.
+    Снимок (sample) считает скорости за время с прошлого снимка и в среднем с начала обхода.
+    Снимки делает сам сканер раз в SAMPLE_INTERVAL, интерфейс читает последний (last_sample).
+    '''
+    def __init__(self) -> None:
+        self.started = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.start_time = time.perf_counter()
+        # Изменяются под блокировкой сканера (см. count_directory)
+        self.directories = 0
+        self.files = 0
+        self.bytes = 0
+        self.errors: Counter[str] = Counter()
+        # Ожидание блокировок поддеревьев, уже законченных другими процессами
+        self.finished_lock_wait = 0.0
+        # {фаза: секунды} в порядке выполнения
+        self.phases: dict[str, float] = {}
+        # {шаг: секунды} для шагов, которые идут параллельно (сумма по всем потокам)
+        self.timers: Counter[str] = Counter()
+        # Замеры подбора числа потоков: [(потоков, папок в секунду)]
+        self.tuning: list[tuple[int, float]] = []
+        self.samples: list[dict[str, Any]] = []
+        self.last_sample: Optional[dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def count_directory(self, files: int, size: int) -> None:
+        '''Учитывает обработанную папку. Вызывается под блокировкой сканера'''
+        self.directories += 1
+        self.files += files
+        self.bytes += size
+
+    def count_error(self, error: BaseException) -> None:
+        with self._lock:
+            self.errors[type(error).__name__] += 1
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timers[name] += seconds
+
+    def merge(self, other: dict[str, Any]) -> None:
+        '''Добавляет итоги сканирования поддерева в другом процессе (см. totals)'''
+        with self._lock:
+            self.errors.update(other['errors'])
+            self.finished_lock_wait += other['lock_wait_seconds']
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            logging.info(f'Фаза {name}: {self.phases[name]:.3f} секунд')
+
+    def totals(self, lock_wait: float) -> dict[str, Any]:
+        with self._lock:
+            errors = dict(self.errors)
+        return {
+            'directories': self.directories,
+            'files': self.files,
+            'bytes': self.bytes,
+            'errors': errors,
+            'lock_wait_seconds': self.finished_lock_wait + lock_wait
+        }
+
+    def sample(self, queue_depth: int, lock_wait: float, threads: int) -> dict[str, Any]:
+        '''
+        Снимает показания. queue_depth — сколько папок ждёт обработки,
+        lock_wait — сколько секунд потоки ждали блокировку таблицы, threads — сколько потоков работает
+        '''
+        now = time.perf_counter()
+        elapsed = now - self.start_time
+        current = self.totals(lock_wait)
+        previous = self.last_sample
+        if previous is None:
+            interval = elapsed
+            previous = {'directories': 0, 'files': 0, 'bytes': 0}
+        else:
+            interval = elapsed - previous['elapsed_seconds']
+        interval = max(interval, 1e-9)
+        entries = current['directories'] + current['files']
+        previous_entries = previous['directories'] + previous['files']
+        sample = {
+            'elapsed_seconds': elapsed,
+            **current,
+            'queue_depth': queue_depth,
+            'threads': threads,
+            'directories_per_second': (current['directories'] - previous['directories']) / interval,
+            'entries_per_second': (entries - previous_entries) / interval,
+            'bytes_per_second': (current['bytes'] - previous['bytes']) / interval,
+            'average_directories_per_second': current['directories'] / max(elapsed, 1e-9),
+            'average_entries_per_second': entries / max(elapsed, 1e-9)
+        }
+        with self._lock:
+            self.samples.append(sample)
+            if len(self.samples) > MAX_SAMPLES:
+                self.samples = self.samples[::2]
+        self.last_sample = sample
+        return sample
+
+    def write_trace(self, path: str, parameters: dict[str, Any], lock_wait: float, is_completed: bool) -> None:
+        '''Пишет трассировку сканирования в JSON'''
+        trace = {
+            'started': self.started,
+            'completed': is_completed,
+            'parameters': parameters,
+            'phases': self.phases,
+            'total_seconds': sum(self.phases.values()),
+            'timers': dict(self.timers),
+            'tuning': self.tuning,
+            'totals': self.totals(lock_wait),
+            'samples': self.samples
+        }
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(trace, f, indent=4, ensure_ascii=False)
+        except OSError as e:
+            logging.warning(f'Не удалось записать трассировку {path}: {e}')
+            return
+        logging.info(f'Трассировка сканирования записана: {path}')
@@ -0,0 +1,154 @@
+import os
+from array import array
+from bisect import bisect_right
+from typing import Callable, Optional
+
+from logic.database import Database, DatabaseWriter
+
+
+# Секции бд с поисковым индексом
+NAMES = 'search.names'
+NAME_OFFSETS = 'search.name_offsets'
+DISPLAY_NAMES = 'search.display_names'
+DISPLAY_OFFSETS = 'search.display_offsets'
+PARENTS = 'search.parents'
+# Разделитель имён: в именах файлов его быть не может
+SEPARATOR = b'\0'
+# Разделители пути текущей ОС
+SEPARATORS = tuple(sep for sep in (os.sep, os.altsep) if sep)
+
+
+def _encode(name: str) -> bytes:
+    return name.encode('utf-8', 'surrogatepass')
+
+
+class SearchIndexBuilder:
+    '''
+    Собирает поисковый индекс по мере записи бд.
+    Элемент индекса — всё, что визуализатор показывает внутри папки: файлы и (свёрнутые) подпапки.
+    Для каждого элемента хранятся имя в нижнем регистре (в общем буфере), исходное имя
+    и номер элемента-родителя. Элемент 0 — корень сканирования.
+    '''
+    def __init__(self, root: str) -> None:
+        self.names = bytearray()
+        self.name_offsets = array('Q')
+        self.display_names = bytearray()
+        self.display_offsets = array('Q')
+        self.parents = array('i')
+        # Корень не участвует в поиске, поэтому его имя в нижнем регистре пустое
+        self._append(-1, root, '')
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def _append(self, parent: int, name: str, lowered: str) -> int:
+        self.name_offsets.append(len(self.names))
+        self.names += _encode(lowered)
+        self.names += SEPARATOR
+        self.display_offsets.append(len(self.display_names))
+        self.display_names += _encode(name)
+        self.parents.append(parent)
+        return len(self.parents) - 1
+
+    def add(self, parent: int, name: str) -> int:
+        '''Добавляет элемент папки parent. Возвращает его номер'''
+        return self._append(parent, name, name.lower())
+
+    def write(self, writer: DatabaseWriter) -> None:
+        # Граничные смещения: конец последнего имени
+        name_offsets = self.name_offsets + array('Q', [len(self.names)])
+        display_offsets = self.display_offsets + array('Q', [len(self.display_names)])
+        writer.add_section(NAMES, self.names)
+        writer.add_section(NAME_OFFSETS, name_offsets.tobytes())
+        writer.add_section(DISPLAY_NAMES, self.display_names)
+        writer.add_section(DISPLAY_OFFSETS, display_offsets.tobytes())
+        writer.add_section(PARENTS, self.parents.tobytes())
+
+
+class SearchIndex:
+    '''
+    Поиск по подстроке в имени. Имена в нижнем регистре лежат одним буфером в бд,
+    поэтому поиск — это поиск подстроки в буфере (при mmap — прямо в отображённом файле),
+    а номер элемента находится двоичным поиском по смещениям.
+    '''
+    def __init__(self, database: Database) -> None:
+        self.database = database
+        if database.mm is not None:
+            self._find = lambda needle, start: database.find_in_section(NAMES, needle, start)
+        else:
+            # Без mmap имена читаются один раз, а не при каждом поиске
+            self._find = bytes(database.section(NAMES) or b'').find
+        self.name_offsets = self._numbers(NAME_OFFSETS, 'Q')
+        self.display_names = database.section(DISPLAY_NAMES) or b''
+        self.display_offsets = self._numbers(DISPLAY_OFFSETS, 'Q')
+        self.parents = self._numbers(PARENTS, 'i')
+
+    @staticmethod
+    def load(database: Database) -> Optional['SearchIndex']:
+        '''Индекс бд или None, если бд записана без него'''
+        if database.section(NAMES) is None:
+            return None
+        return SearchIndex(database)
+
+    def close(self) -> None:
+        '''
+        Освобождает срезы отображения бд. Пока они живы, Database.close не может закрыть файл.
+        После закрытия индексом пользоваться нельзя
+        '''
+        for view in (self.name_offsets, self.display_offsets, self.parents, self.display_names):
+            if isinstance(view, memoryview):
+                view.release()
+
+    def _numbers(self, name: str, typecode: str) -> memoryview:
+        data = self.database.section(name)
+        if data is None:
+            raise KeyError(name)
+        return memoryview(data).cast(typecode)
+
+    def name(self, entry: int) -> str:
+        start, end = self.display_offsets[entry], self.display_offsets[entry + 1]
+        return bytes(self.display_names[start:end]).decode('utf-8', 'surrogatepass')
+
+    def find(self, query: str, is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[list[int]]:
+        '''
+        Номера элементов, в имени которых есть query (без учёта регистра).
+        None, если поиск отменён
+        '''
+        needle = _encode(query.lower()).replace(SEPARATOR, b'')
+        if not needle:
+            return []
+        found: list[int] = []
+        position = self._find(needle, 0)
+        while position != -1:
+            entry = bisect_right(self.name_offsets, position) - 1
+            found.append(entry)
+            if is_cancelled is not None and len(found) % 1024 == 0 and is_cancelled():
+                return None
+            # Одно совпадение на элемент: продолжаем со следующего имени
+            position = self._find(needle, self.name_offsets[entry + 1])
+        return found
+
+    def search(self, query: str, is_cancelled: Optional[Callable[[], bool]] = None) -> Optional[set[str]]:
+        '''
+        Пути найденных элементов вместе со всеми их предками (включая корень).
+        None, если поиск отменён
+        '''
+        found = self.find(query, is_cancelled)
+        if found is None:
+            return None
+        paths: dict[int, str] = {0: self.name(0)}
+        parents = self.parents
+        for i, entry in enumerate(found):
+            if is_cancelled is not None and i % 1024 == 0 and is_cancelled():
+                return None
+            # Поднимаемся до уже известного предка, затем собираем пути сверху вниз
+            chain: list[int] = []
+            while entry not in paths:
+                chain.append(entry)
+                entry = parents[entry]
+            path = paths[entry]
+            for entry in reversed(chain):
+                # То же, что os.path.join, но без лишних проверок: имя никогда не абсолютное
+                path = (path if path.endswith(SEPARATORS) else path + os.sep) + self.name(entry)
+                paths[entry] = path
+        return set(paths.values())
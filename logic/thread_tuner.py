@@ -0,0 +1,76 @@
+from typing import Optional
+
+
+# Пределы подбора числа потоков
+AUTO_MIN_THREADS = 1
+AUTO_MAX_THREADS = 128
+# Сколько секунд длится один замер скорости и сколько замеров делается в начале сканирования
+TUNE_STEP_SECONDS = 0.5
+TUNE_MAX_STEPS = 10
+# Во сколько раз скорость должна вырасти, чтобы новое число потоков считалось лучше
+TUNE_MIN_GAIN = 1.1
+
+
+class ThreadTuner:
+    '''
+    Подбор числа потоков по скорости обхода (папок в секунду) восхождением к вершине.
+    Сначала меряется скорость при начальном числе потоков, затем пробуется вдвое больше;
+    если прироста нет — вдвое меньше. В удачную сторону шаги продолжаются, пока скорость растёт,
+    после первой неудачи (или TUNE_MAX_STEPS замеров) остаётся лучшее найденное число.
+
+    Сам ничего не запускает: SizeFinder раз в TUNE_STEP_SECONDS передаёт скорость в update
+    и ставит столько потоков, сколько тот вернул.
+    '''
+    def __init__(
+            self, initial: int,
+            minimum: int = AUTO_MIN_THREADS, maximum: int = AUTO_MAX_THREADS,
+            max_steps: int = TUNE_MAX_STEPS
+        ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_steps = max_steps
+        self.current = self._clamp(initial)
+        self.best = self.current
+        self.best_rate: Optional[float] = None
+        # 2 — вверх, 0.5 — вниз
+        self.factor = 2.0
+        self.steps = 0
+        self.is_finished = False
+        # [(потоков, папок в секунду)] по шагам
+        self.history: list[tuple[int, float]] = []
+
+    def _clamp(self, threads: int) -> int:
+        return max(self.minimum, min(int(threads), self.maximum))
+
+    def update(self, rate: float) -> int:
+        '''Скорость за последний замер при self.current потоков. Возвращает число потоков на следующий замер'''
+        if self.is_finished:
+            return self.current
+        self.steps += 1
+        self.history.append((self.current, rate))
+
+        if self.best_rate is None or self.current == self.best:
+            # Первый замер (или повтор лучшего): только запоминаем
+            self.best_rate = max(rate, self.best_rate or 0.0)
+        elif rate > self.best_rate * TUNE_MIN_GAIN:
+            self.best, self.best_rate = self.current, rate
+        elif self.factor > 1 and self.best == self.history[0][0]:
+            # Вверх сразу не вышло: пробуем вниз от начального
+            self.factor = 0.5
+        else:
+            return self._finish()
+
+        candidate = self._clamp(self.best * self.factor)
+        if candidate == self.best and self.factor > 1:
+            # Упёрлись в максимум: проверяем направление вниз
+            self.factor = 0.5
+            candidate = self._clamp(self.best * self.factor)
+        if candidate == self.best or self.steps >= self.max_steps:
+            return self._finish()
+        self.current = candidate
+        return self.current
+
+    def _finish(self) -> int:
+        self.is_finished = True
+        self.current = self.best
+        return self.current
@@ -0,0 +1,201 @@
+import heapq
+import threading
+from itertools import count
+from collections import deque
+from typing import Callable, Iterable, Optional
+
+
+class WorkStealingQueue[T]:
+    '''
+    Очередь задач с отдельной декой у каждого потока.
+    Поток кладёт задачи пачкой в свою деку (push) и берёт их оттуда же с конца (get):
+    обход идёт вглубь, и потоки почти не толкаются на общей блокировке.
+    Опустевший поток забирает задачу с начала чужой деки — самую старую,
+    то есть самую близкую к корню и обычно самую большую.
+
+    Окончание работы определяется счётчиком незавершённых задач: он растёт при push
+    и уменьшается при task_done. Когда он доходит до нуля, get возвращает None всем потокам,
+    поэтому ни join очереди, ни сигналы остановки (None в очереди) не нужны.
+
+    Работают только первые active потоков (см. set_active), остальные ждут в get,
+    а задачи из их дек разбирают работающие.
+    '''
+    def __init__(self, workers: int) -> None:
+        self.deques: list[deque[T]] = [deque() for _ in range(max(1, workers))]
+        self.active = len(self.deques)
+        # Задачи, которые положены, но ещё не завершены (включая выполняемые сейчас)
+        self.pending = 0
+        self.closed = False
+        # Потоки, которые ждут работу
+        self.idle = 0
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock)
+        # Отдельное условие для остановленных потоков, чтобы notify в push не тратился на них
+        self._resumed = threading.Condition(lock)
+
+    def push(self, worker: int, items: Iterable[T]) -> None:
+        '''Кладёт пачку задач в деку потока worker одной блокировкой'''
+        items = list(items)
+        if not items:
+            return
+        with self._condition:
+            self.pending += len(items)
+            self.deques[worker].extend(items)
+            if self.idle:
+                self._condition.notify(min(len(items), self.idle))
+
+    def get(self, worker: int) -> Optional[T]:
+        '''
+        Следующая задача для потока worker: своя, украденная или дождавшаяся.
+        None — работа закончена или очередь закрыта
+        '''
+        own = self.deques[worker]
+        while not self.closed:
+            if worker >= self.active:
+                with self._resumed:
+                    if self.closed or self.pending == 0:
+                        return None
+                    if worker >= self.active:
+                        self._resumed.wait()
+                continue
+            try:
+                return own.pop()
+            except IndexError:
+                pass
+            item = self._steal(worker)
+            if item is not None:
+                return item
+            with self._condition:
+                if self.closed or self.pending == 0:
+                    return None
+                # Задачи, положенные до захвата блокировки, видны здесь; положенные после — разбудят notify
+                if not any(self.deques):
+                    self.idle += 1
+                    self._condition.wait()
+                    self.idle -= 1
+        return None
+
+    def _steal(self, worker: int) -> Optional[T]:
+        count = len(self.deques)
+        for offset in range(1, count):
+            victim = self.deques[(worker + offset) % count]
+            if not victim:
+                continue
+            try:
+                return victim.popleft()
+            except IndexError:
+                # Её успел опустошить другой поток
+                continue
+        return None
+
+    def task_done(self) -> None:
+        '''Задача, полученная через get, выполнена (её подзадачи уже положены через push)'''
+        with self._condition:
+            self.pending -= 1
+            if self.pending == 0:
+                self._condition.notify_all()
+                self._resumed.notify_all()
+
+    def set_active(self, active: int) -> None:
+        '''Сколько потоков (с номерами 0..active-1) берут задачи'''
+        with self._condition:
+            self.active = max(1, min(active, len(self.deques)))
+            self._resumed.notify_all()
+            # Остановленные потоки могли ждать работу в общем условии: пусть перейдут в своё
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        '''Прерывает работу: get сразу возвращает None'''
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._resumed.notify_all()
+
+    def drain(self) -> list[T]:
+        '''Забирает все лежащие задачи в порядке добавления. Для однопоточного использования'''
+        items: list[T] = []
+        for queue in self.deques:
+            items.extend(queue)
+            queue.clear()
+        self.pending = 0
+        return items
+
+    def qsize(self) -> int:
+        return sum(len(queue) for queue in self.deques)
+
+
+class InodeOrderQueue[T]:
+    '''
+    Общая очередь задач, которая выдаёт их по возрастанию ключа (номера inode папки).
+    На ext4/XFS номера inode примерно повторяют расположение на диске, поэтому HDD читает
+    таблицу inode проходами в одну сторону, а не прыгает между далёкими папками.
+
+    Выдача идёт как у лифта: ключ задачи не меньше ключа последней выданной.
+    Задачи с меньшим ключом, найденные во время прохода, ждут следующего прохода с начала.
+
+    Интерфейс тот же, что у WorkStealingQueue, но номер потока ни на что не влияет:
+    все потоки берут задачи из одной кучи, а их число и есть предел папок в работе.
+    '''
+    def __init__(self, key: Callable[[T], int]) -> None:
+        self.key = key
+        # Кучи (ключ, порядковый номер, задача) текущего и следующего прохода.
+        # Порядковый номер нужен, чтобы задачи с одинаковым ключом не сравнивались между собой
+        self._current: list[tuple[int, int, T]] = []
+        self._next: list[tuple[int, int, T]] = []
+        self._position = 0
+        self._order = count()
+        self.pending = 0
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def push(self, worker: int, items: Iterable[T]) -> None:
+        '''Кладёт пачку задач одной блокировкой'''
+        with self._condition:
+            added = 0
+            for item in items:
+                key = self.key(item)
+                heap = self._current if key >= self._position else self._next
+                heapq.heappush(heap, (key, next(self._order), item))
+                added += 1
+            if added:
+                self.pending += added
+                self._condition.notify(added)
+
+    def get(self, worker: int) -> Optional[T]:
+        '''Задача с наименьшим ключом в текущем проходе. None — работа закончена или очередь закрыта'''
+        with self._condition:
+            while not self.closed:
+                if not self._current and self._next:
+                    self._current, self._next = self._next, self._current
+                if self._current:
+                    self._position, _, item = heapq.heappop(self._current)
+                    return item
+                if self.pending == 0:
+                    return None
+                self._condition.wait()
+        return None
+
+    def task_done(self) -> None:
+        with self._condition:
+            self.pending -= 1
+            if self.pending == 0:
+                self._condition.notify_all()
+
+    def set_active(self, active: int) -> None:
+        '''Все запущенные потоки берут задачи: их число задаётся при запуске'''
+
+    def close(self) -> None:
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def drain(self) -> list[T]:
+        '''Забирает все лежащие задачи в порядке выдачи. Для однопоточного использования'''
+        items = [item for _, _, item in sorted(self._current) + sorted(self._next)]
+        self._current.clear()
+        self._next.clear()
+        self.pending = 0
+        return items
+
+    def qsize(self) -> int:
+        return len(self._current) + len(self._next)
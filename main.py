@@ -1,9 +1,10 @@
 import threading
 import logging
+import multiprocessing
 
 from utils import load_all_databases, update_language
 from config import set_default_values, SETTINGS, LANGUAGE, TRANSLATOR, path_to_resource
-from ui import DiskVisualizerApp, DiskIndexingApp
+from ui import DiskIndexingApp
 import ui.minimal_loader_app as minimal_loader_app
 
 
@@ -39,6 +40,7 @@ def main() -> None:
 
             from config import is_should_run_visualizer
             if is_should_run_visualizer:
+                from ui import DiskVisualizerApp
                 visualizer_app = DiskVisualizerApp(databases, icon_path)
                 visualizer_app.iconbitmap(icon_path) # pyright: ignore[reportUnknownMemberType]
                 visualizer_app.mainloop() # pyright: ignore[reportUnknownMemberType]
@@ -55,4 +57,6 @@ def main() -> None:
 
 
 if __name__ == '__main__':
+    # Нужно для процессного бэкенда сканирования в собранном приложении
+    multiprocessing.freeze_support()
     main()
@@ -3,7 +3,7 @@ import json
 import logging
 from typing import Any
 
-VERSION = '1.8.2'
+VERSION = '1.8.3'
 
 REQUIRED_SETTINGS = [
     'version',
@@ -11,14 +11,18 @@ REQUIRED_SETTINGS = [
     'language',
     'theme',
     'color_map',
-    'visualize_type'
+    'visualize_type',
+    'scan_backend',
+    'record_cache_mb',
+    'size_type'
 ]
 
 
 class Settings:
-    def __init__(self, settings_path: str) -> None:
+    def __init__(self, settings_path: str, read_only: bool = False) -> None:
         logging.info(f'Загрузка конфигурационного файла: {settings_path}')
         self.path = settings_path
+        self.read_only = read_only
         self.data: dict[str, Any] = {}
         if os.path.exists(self.path):
             logging.info(f'Конфигурационный файл обнаружен, загрузка...')
@@ -107,6 +111,24 @@ class Settings:
                     'TreeMap',
                     'Columns'
                 ]
+            },
+            'scan_backend': {
+                'current': 'Threads',
+                'available': [
+                    'Threads',
+                    'Processes',
+                    'Inode order'
+                ]
+            },
+            # Лимит кэша распакованных записей визуализатора, МБ
+            'record_cache_mb': {
+                'current': 256,
+                'available': [64, 128, 256, 512, 1024]
+            },
+            # Какой размер показывает визуализатор: st_size или место на диске
+            'size_type': {
+                'current': 'Apparent size',
+                'available': ['Apparent size', 'Allocated size']
             }
         }
 
@@ -119,6 +141,8 @@ class Settings:
                     self.data[key][option] = data[key][option]
 
     def save(self) -> None:
+        if self.read_only:
+            return
         logging.info('Сохранение конфигурационного файла...')
         try:
             with open(self.path, 'w') as f:
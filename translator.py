@@ -1,5 +1,3 @@
-import polib
-
 import os
 import gettext
 import logging
@@ -10,7 +8,8 @@ import config
 FILES = [
     'formatting',
     'disk_indexing',
-    'visualizer'
+    'visualizer',
+    'cli'
 ]
 
 
@@ -36,7 +35,8 @@ class Translator:
             for file in FILES:
                 path_to_file = os.path.join(config.DATA_DIR, 'locales', lang, file)
 
-                if os.path.exists(path_to_file+'.po'):
+                if self._is_mo_outdated(path_to_file):
+                    import polib
                     po = polib.pofile(path_to_file+'.po')
                     po.save_as_mofile(path_to_file+'.mo')
                 
@@ -59,6 +59,15 @@ class Translator:
 
         return True
 
+    @staticmethod
+    def _is_mo_outdated(path_to_file: str) -> bool:
+        '''.mo нужно собрать заново, если .po новее (или .mo ещё нет)'''
+        if not os.path.exists(path_to_file+'.po'):
+            return False
+        if not os.path.exists(path_to_file+'.mo'):
+            return True
+        return os.path.getmtime(path_to_file+'.po') > os.path.getmtime(path_to_file+'.mo')
+
     def gettext(self, filename: str):
         return self.translates[filename].gettext
 
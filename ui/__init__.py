@@ -1,7 +1,19 @@
+from typing import TYPE_CHECKING, Any
+
 from .loader_frame import LoaderFrame
 from .settings_ui import SettingsWindow
 from .disk_indexing import DiskIndexingApp
-from .visualizer import DiskVisualizerApp
+
+if TYPE_CHECKING:
+    from .visualizer import DiskVisualizerApp
 
 
 __all__ = ['DiskIndexingApp', 'DiskVisualizerApp', 'LoaderFrame', 'SettingsWindow']
+
+
+def __getattr__(name: str) -> Any:
+    # Визуализатор (и вся отрисовка) загружается, только когда его открывают
+    if name == 'DiskVisualizerApp':
+        from .visualizer import DiskVisualizerApp
+        return DiskVisualizerApp
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -97,6 +97,16 @@ class DiskIndexingApp(ctk.CTk):
         self.scan_folder_button = ctk.CTkButton(self.scrollable_frame, text=_("Scan specific folder..."), command=self.scan_custom_folder, fg_color="#3b3b3b")
         self.scan_folder_button.grid(row=path_row, column=0, padx=10, pady=(10, 10), sticky="ew") # pyright: ignore[reportUnknownMemberType]
 
+        # Переключатель инкрементального сканирования (перечитываются только изменённые папки)
+        self.incremental_var = ctk.BooleanVar(value=False)
+        self.incremental_switch = ctk.CTkSwitch(self.scrollable_frame, text=_("Rescan only changed folders"), variable=self.incremental_var)
+        self.incremental_switch.grid(row=path_row+1, column=0, padx=10, pady=(0, 10), sticky="w") # pyright: ignore[reportUnknownMemberType]
+
+        # Переключатель учёта жёстких ссылок: файл с несколькими ссылками считается один раз
+        self.hardlinks_var = ctk.BooleanVar(value=False)
+        self.hardlinks_switch = ctk.CTkSwitch(self.scrollable_frame, text=_("Count hard-linked files once"), variable=self.hardlinks_var)
+        self.hardlinks_switch.grid(row=path_row+2, column=0, padx=10, pady=(0, 10), sticky="w") # pyright: ignore[reportUnknownMemberType]
+
         # Прогресс бар
         self.progress_bar = ctk.CTkProgressBar(self)
         self.progress_bar.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="ew") # pyright: ignore[reportUnknownMemberType]
@@ -165,6 +175,13 @@ class DiskIndexingApp(ctk.CTk):
                 "current": SETTINGS['theme']['current'],
                 "callback": self.on_appearance_changed
             },
+            {
+                "label": _("Scan backend:"),
+                "options": SETTINGS['scan_backend']['available'],
+                "current": SETTINGS['scan_backend']['current'],
+                "display_map": {en: _(en) for en in SETTINGS['scan_backend']['available']},
+                "callback": self.on_scan_backend_changed
+            },
         ]
 
         SettingsWindow(
@@ -191,6 +208,12 @@ class DiskIndexingApp(ctk.CTk):
         ctk.set_appearance_mode(appearance)
         logging.info(f"Режим отображения изменен на: {appearance}")
 
+    def on_scan_backend_changed(self, backend: str):
+        """Обработчик изменения бэкенда сканирования"""
+        SETTINGS['scan_backend']['current'] = backend
+        SETTINGS.save()
+        logging.info(f"Бэкенд сканирования изменен на: {backend}")
+
     def on_restart(self):
         global _
         _ = TRANSLATOR.gettext('disk_indexing')
@@ -374,16 +397,24 @@ class DiskIndexingApp(ctk.CTk):
         if self.current_size_finder:
             total = self.current_size_finder.total
             current = self.current_size_finder.current
+            # Скорость по последним показаниям счётчиков сканера
+            sample = self.current_size_finder.stats.last_sample
+            rates = ""
+            if sample is not None:
+                rates = "\n" + _("{directories} folders/s, {speed}/s").format(
+                    directories=int(sample['directories_per_second']),
+                    speed=format_bytes(sample['bytes_per_second'])
+                )
             
             # Избегаем деления на ноль
             if total > 0:
                 progress = current / total
                 self.progress_bar.set(progress) # pyright: ignore[reportUnknownMemberType]
-                self.status_label.configure(text=_("Processed:") + f"{format_bytes(current)} / {format_bytes(total)} ({int(progress*100)}%)") # pyright: ignore[reportUnknownMemberType]
+                self.status_label.configure(text=_("Processed:") + f"{format_bytes(current)} / {format_bytes(total)} ({int(progress*100)}%)" + rates) # pyright: ignore[reportUnknownMemberType]
             else:
                 # Если total еще не подсчитан или равен 0
                 self.progress_bar.set(0) # pyright: ignore[reportUnknownMemberType]
-                self.status_label.configure(text=_("Counting files...") + f"{format_bytes(current)}") # pyright: ignore[reportUnknownMemberType]
+                self.status_label.configure(text=_("Counting files...") + f"{format_bytes(current)}" + rates) # pyright: ignore[reportUnknownMemberType]
 
         # Планируем следующий вызов через 100 мс
         self.after(100, self.update_progress_loop)
@@ -392,7 +423,12 @@ class DiskIndexingApp(ctk.CTk):
         try:
             for path in paths:
                 # Сохраняем экземпляр в self, чтобы update_progress_loop мог его видеть
-                self.current_size_finder = SizeFinder(self.databases[path], path)
+                self.current_size_finder = SizeFinder(
+                    self.databases[path], path,
+                    incremental=self.incremental_var.get(),
+                    backend=SETTINGS['scan_backend']['current'],
+                    count_hardlinks_once=self.hardlinks_var.get()
+                )
                 
                 # Обновляем текст в главном потоке (опционально)
                 self.label.configure(text=_("Scanning:") + f"{path}") # pyright: ignore[reportUnknownMemberType]
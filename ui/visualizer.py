@@ -6,14 +6,12 @@ import os
 import math
 import logging
 import threading
-import pickle
-import compression.zstd
 import time
-from typing import Any
+from typing import Any, Callable, Optional
 
-from logic import Database
+from logic import Database, RecordCache, SearchIndex
 from config import DATA_DIR, set_should_run_analyzer, SETTINGS, PLATFORM, TRANSLATOR
-from utils import ColorCache, format_bytes, update_language, render_pipeline
+from utils import ColorCache, HitIndex, LayoutCache, RenderScheduler, format_bytes, update_language, render_pipeline
 from ui import LoaderFrame, SettingsWindow
 
 _ = TRANSLATOR.gettext('visualizer')
@@ -21,6 +19,11 @@ _ = TRANSLATOR.gettext('visualizer')
 
 color_cache = ColorCache(SETTINGS['color_map']['current'])
 
+# Поле размера в записях бд для настройки size_type
+SIZE_FIELDS = {'Apparent size': 's', 'Allocated size': 'a'}
+# Сколько окно ждёт остановки поиска перед освобождением поискового индекса, секунд
+SEARCH_CLOSE_TIMEOUT = 1.0
+
 ctk.set_appearance_mode(SETTINGS['theme']['current'])
 ctk.set_default_color_theme('blue')
 
@@ -38,7 +41,14 @@ class DiskVisualizerApp(ctk.CTk):
         # Создаем меню
         self.create_menu()
 
+        # Поисковый индекс нужно освободить до закрытия бд (см. close_search_index)
+        self.protocol("WM_DELETE_WINDOW", self.on_close) # pyright: ignore[reportUnknownMemberType]
+
         self.raw_data: Database
+        # Распакованные записи текущей бд (общие для отрисовки и поиска)
+        self.records: RecordCache
+        # Поисковый индекс текущей бд (None для бд без индекса)
+        self.search_index: Optional[SearchIndex] = None
         self.databases = databases
         self.icon_path = icon_path
         self.search_data: set[str] = set()
@@ -47,14 +57,16 @@ class DiskVisualizerApp(ctk.CTk):
         self.global_max_log = 1.0
         self.is_search_bar_active = False
 
-        self.hit_map = []
+        self.hit_index = HitIndex([], 1, 1)
         self.current_tk_image = None
         self.highlight_rect_id = None
         
         self._resize_job = None
-        self._render_lock = threading.Lock()
+        # Единственный поток отрисовки: новая задача отменяет предыдущую
+        self.render_scheduler = RenderScheduler()
+        # Макеты недавно показанных папок текущей бд
+        self.layout_cache = LayoutCache()
         self._search_lock = threading.Lock()
-        self._data_lock = threading.Lock()
         self._search_workers = 0
         
         # GUI
@@ -199,6 +211,20 @@ class DiskVisualizerApp(ctk.CTk):
                 'current': SETTINGS['visualize_type']['current'],
                 'display_map': {en: _(en) for en in SETTINGS['visualize_type']['available']},
                 'callback': self.on_visualize_type
+            },
+            {
+                'label': _("Decoded data cache:"),
+                'options': SETTINGS['record_cache_mb']['available'],
+                'current': SETTINGS['record_cache_mb']['current'],
+                'display_map': {mb: f'{mb} MB' for mb in SETTINGS['record_cache_mb']['available']},
+                'callback': self.on_record_cache_changed
+            },
+            {
+                'label': _("Size:"),
+                'options': SETTINGS['size_type']['available'],
+                'current': SETTINGS['size_type']['current'],
+                'display_map': {en: _(en) for en in SETTINGS['size_type']['available']},
+                'callback': self.on_size_type_changed
             }
         ]
 
@@ -215,6 +241,23 @@ class DiskVisualizerApp(ctk.CTk):
         logging.info(f"Тип визуализации изменен на: {visualize_type}")
         self.after(0, self.trigger_render)
 
+    def on_record_cache_changed(self, max_megabytes: int):
+        SETTINGS['record_cache_mb']['current'] = max_megabytes
+        SETTINGS.save()
+        logging.info(f"Размер кэша записей изменен на: {max_megabytes} МБ")
+        if hasattr(self, 'records'):
+            self.records.resize(max_megabytes * 1024 * 1024)
+
+    def on_size_type_changed(self, size_type: str):
+        SETTINGS['size_type']['current'] = size_type
+        SETTINGS.save()
+        logging.info(f"Показываемый размер изменен на: {size_type}")
+        if hasattr(self, 'records'):
+            # Оба размера уже есть в бд: пересканировать не нужно
+            self.records.set_size_field(SIZE_FIELDS[size_type])
+            self.update_global_max_log()
+            self.after(0, self.trigger_render)
+
     def on_update_language(self):
         if SETTINGS['language']['current'] == 'en':
             return
@@ -234,6 +277,7 @@ class DiskVisualizerApp(ctk.CTk):
 
     def on_restart(self):
         set_should_run_analyzer(True)
+        self.close_search_index()
         self.destroy()
 
     def show_pop_up_after_change_language(self, text: list[str]) -> None:
@@ -332,6 +376,29 @@ class DiskVisualizerApp(ctk.CTk):
         self._search_workers = 0
         self.after(0, self.trigger_render)
 
+    def _search_without_index(self, search_str: str, temp_data: set[str]) -> bool:
+        '''
+        Поиск перебором всех записей (для бд, записанных без поискового индекса).
+        Возвращает False, если поиск отменён
+        '''
+        for path in self.raw_data:
+            if path.startswith('__'): continue
+            for folder in self.records.subfolders(path):
+                if self._search_workers > 1: return False
+                if search_str in folder['n'].lower():
+                    current = folder['p']
+                    while current != self.scan_root_path:
+                        temp_data.add(current)
+                        current = os.path.dirname(current)
+            for file in self.records.files(path):
+                if self._search_workers > 1: return False
+                if search_str in file['n'].lower():
+                    current = file['p']
+                    while current != self.scan_root_path:
+                        temp_data.add(current)
+                        current = os.path.dirname(current)
+        return True
+
     def _on_search_thread(self) -> None:
         if self._search_lock.locked():
             time.sleep(0.1)
@@ -345,31 +412,22 @@ class DiskVisualizerApp(ctk.CTk):
         self.search_loader.start()
         try:
             search_str = self.search_var.get().strip().lower()
-            for path in self.raw_data:
-                if path.startswith('__'): continue
-                with self._data_lock:
-                    data = self.raw_data[path]
-                for folder in pickle.loads(compression.zstd.decompress(data['subfolders'])):
-                    if self._search_workers > 1: return
-                    if search_str in folder['n'].lower():
-                        current = folder['p']
-                        while current != self.scan_root_path:
-                            temp_data.add(current)
-                            current = os.path.dirname(current)
-                for file in pickle.loads(compression.zstd.decompress(data['files'])):
-                    if self._search_workers > 1: return
-                    if search_str in file['n'].lower():
-                        current = file['p']
-                        while current != self.scan_root_path:
-                            temp_data.add(current)
-                            current = os.path.dirname(current)
+            # Индекс читается один раз: close_search_index может заменить его, пока идёт поиск
+            search_index = self.search_index
+            if search_index is not None:
+                found = search_index.search(search_str, lambda: self._search_workers > 1)
+                if found is None: return
+                temp_data = found
+            elif not self._search_without_index(search_str, temp_data):
+                return
             temp_data.add(self.scan_root_path)
         finally:
             if self._search_workers == 1:
                 self.search_data = temp_data
                 self.after(0, self.trigger_render)
-            self._search_lock.release()
+            # Счётчик меняется до освобождения блокировки: close_search_index сбрасывает его под ней
             self._search_workers -= 1
+            self._search_lock.release()
 
     def on_search(self, *_args: Any) -> None:
         search_str = self.search_var.get().strip().lower()
@@ -397,12 +455,54 @@ class DiskVisualizerApp(ctk.CTk):
 
     def change_data(self, path: str) -> None:
         self.raw_data = self.databases[path]
+        self.records = RecordCache(
+            self.raw_data,
+            SETTINGS['record_cache_mb']['current'] * 1024 * 1024,
+            SIZE_FIELDS[SETTINGS['size_type']['current']]
+        )
+        self.close_search_index()
+        self.search_index = SearchIndex.load(self.raw_data)
+        self.layout_cache.clear()
         self.scan_root_path = self.raw_data['__root__']
-        if self.scan_root_path in self.raw_data:
-            size = self.raw_data[self.scan_root_path]['s']
-            self.global_max_log = math.log10(size)
+        self.update_global_max_log()
         self.change_directory(self.scan_root_path)
 
+    def close_search_index(self) -> None:
+        '''
+        Освобождает поисковый индекс: пока он ссылается на отображение бд, её нельзя закрыть, заменить или удалить.
+        Идущий поиск сначала отменяется (как в _cancel_search_thread), чтобы окно не ждало его до конца
+        '''
+        self._search_workers += 100
+        search_index, self.search_index = self.search_index, None
+        if not self._release_search_index(search_index, SEARCH_CLOSE_TIMEOUT):
+            logging.warning(f'Поиск не остановился за {SEARCH_CLOSE_TIMEOUT} с: поисковый индекс закроется, когда он завершится')
+            threading.Thread(target=self._release_search_index, args=(search_index, -1), daemon=True).start()
+
+    def _release_search_index(self, search_index: Optional[SearchIndex], timeout: float) -> bool:
+        '''
+        Дожидается остановки поиска и закрывает search_index.
+        False — поиск не остановился за timeout секунд (-1 — ждать сколько угодно)
+        '''
+        if not self._search_lock.acquire(timeout=timeout):
+            return False
+        try:
+            if search_index is not None:
+                search_index.close()
+        finally:
+            self._search_workers = 0
+            self._search_lock.release()
+        return True
+
+    def on_close(self):
+        self.close_search_index()
+        self.destroy()
+
+    def update_global_max_log(self) -> None:
+        '''Логарифм размера корня сканирования: по нему нормируются цвета'''
+        if self.scan_root_path in self.raw_data:
+            size = self.records.size(self.scan_root_path)
+            self.global_max_log = math.log10(max(size, 1))
+
     def change_directory(self, path_str: str):
         self.current_root = path_str
         self.search_data = set()
@@ -461,35 +561,41 @@ class DiskVisualizerApp(ctk.CTk):
         if not self.current_root: return
         w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
         
-        logging.info('Запуск пайплайна отрисовки')
-        threading.Thread(target=self._render_pipeline, args=(w, h), daemon=True).start()
+        logging.info('Запуск пайплайна отрисовки')
+        self.render_scheduler.submit(
+            lambda max_depth, is_cancelled: self._render_pipeline(w, h, max_depth, is_cancelled)
+        )
 
-    def _render_pipeline(self, width: int, height: int):
+    def _render_pipeline(self, width: int, height: int, max_depth: Optional[int], is_cancelled: Callable[[], bool]) -> bool:
         '''
-        Пайплайн отрисовки
+        Пайплайн отрисовки (выполняется в потоке RenderScheduler).
+        Возвращает True, если показан полный макет и следующие проходы не нужны
         '''
-        if not self._render_lock.acquire(blocking=False):
-            return
-
-        try:
-            image, hit_map = render_pipeline(
-                SETTINGS['visualize_type']['current'],
-                width, height,
-                self.current_root,
-                self.raw_data,
-                color_cache,
-                self.global_max_log,
-                self.search_data,
-                True if SETTINGS['color_map']['current'] == 'Nesting' else False,
-                self._data_lock
-            )
-            self.after(0, lambda: self._update_canvas(image, hit_map))
-        finally:
-            self._render_lock.release()
-            logging.info('Пайплайн отрисовки завершён')
-
-    def _update_canvas(self, pil_image: Image.Image, hit_map: list[tuple[float, float, float, float, str, str, float, bool]]):
-        self.hit_map = hit_map
+        result = render_pipeline(
+            SETTINGS['visualize_type']['current'],
+            width, height,
+            self.current_root,
+            self.records,
+            color_cache,
+            self.global_max_log,
+            self.search_data,
+            True if SETTINGS['color_map']['current'] == 'Nesting' else False,
+            max_depth,
+            is_cancelled,
+            self.layout_cache
+        )
+        if result is None:
+            return False
+        image, hit_map, is_full = result
+        # Сетка строится здесь, чтобы не занимать поток интерфейса
+        hit_index = HitIndex(hit_map, width, height)
+        # Пока результат ждал потока интерфейса, могла начаться новая отрисовка
+        self.after(0, lambda: None if is_cancelled() else self._update_canvas(image, hit_index))
+        logging.info(f'Пайплайн отрисовки завершён ({max_depth=}, {is_full=})')
+        return is_full
+
+    def _update_canvas(self, pil_image: Image.Image, hit_index: HitIndex):
+        self.hit_index = hit_index
         self.current_tk_image = ImageTk.PhotoImage(pil_image)
         self.highlight_rect_id = None
         self.canvas.delete("all")
@@ -499,12 +605,7 @@ class DiskVisualizerApp(ctk.CTk):
         mx = self.canvas.canvasx(event.x) # type: ignore
         my = self.canvas.canvasy(event.y) # type: ignore
         
-        found = None
-        for i in range(len(self.hit_map) - 1, -1, -1):
-            item = self.hit_map[i]
-            if item[0] <= mx <= item[2] and item[1] <= my <= item[3]:
-                found = item
-                break
+        found = self.hit_index.find(mx, my)
         
         if not getattr(self, 'tooltip_text', None) or self.canvas.type(self.tooltip_text) is None:
             self.tooltip_bg = self.canvas.create_rectangle(0, 0, 0, 0, fill="#2b2b2b", outline="#a0a0a0", state="hidden")
@@ -512,8 +613,7 @@ class DiskVisualizerApp(ctk.CTk):
 
         if found:
             name, size_str = found[5], format_bytes(found[6])
-            with self._data_lock:
-                current_root_size = self.raw_data[self.current_root]['s'] or 1
+            current_root_size = self.records.size(self.current_root) or 1
             pct = (found[6] / current_root_size * 100)
             is_file = found[7]
             type_label = _("File") if is_file else _("Folder")
@@ -557,26 +657,20 @@ class DiskVisualizerApp(ctk.CTk):
             self.status_bar.configure(text=_("Program is ready")) # pyright: ignore
 
     def on_left_click(self, event: Any):
-        mx, my = event.x, event.y
-        for i in range(len(self.hit_map) - 1, -1, -1):
-            item = self.hit_map[i]
-            if item[0] <= mx <= item[2] and item[1] <= my <= item[3]:
-                path, is_file = item[4], item[7]
-                if not is_file and path in self.raw_data:
-                    self.change_directory(path)
-                return
+        item = self.hit_index.find(event.x, event.y)
+        if item is not None:
+            path, is_file = item[4], item[7]
+            if not is_file and path in self.raw_data:
+                self.change_directory(path)
 
     def on_right_click(self, event: Any):
-        mx, my = event.x, event.y
-        for i in range(len(self.hit_map) - 1, -1, -1):
-            item = self.hit_map[i]
-            if item[0] <= mx <= item[2] and item[1] <= my <= item[3]:
-                self.selected_item = item
-                try:
-                    self.context_menu.tk_popup(event.x_root, event.y_root)
-                finally:
-                    self.context_menu.grab_release()
-                return
+        item = self.hit_index.find(event.x, event.y)
+        if item is not None:
+            self.selected_item = item
+            try:
+                self.context_menu.tk_popup(event.x_root, event.y_root)
+            finally:
+                self.context_menu.grab_release()
 
     def open_in_explorer(self):
         if self.selected_item and self.selected_item[4]:
@@ -595,4 +689,5 @@ class DiskVisualizerApp(ctk.CTk):
 
     def return_to_analyzer(self):
         set_should_run_analyzer(True)
+        self.close_search_index()
         self.destroy()
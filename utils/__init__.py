@@ -1,15 +1,60 @@
-from .color_cache import ColorCache
-from .squarify_local import squarify, normalize_sizes
+import importlib
+from typing import TYPE_CHECKING, Any
+
+from .render_scheduler import RenderScheduler
 from .formatting import format_path, format_bytes, format_date_to_time_ago
 from .db_interact import load_all_databases, create_database, delete_database
 from .update_language import update_language
-from .render_pipelines import render_pipeline
+
+if TYPE_CHECKING:
+    from .color_cache import ColorCache
+    from .squarify_local import squarify, normalize_sizes, squarify_array, normalize_sizes_array
+    from .rasterizer import RECT_DTYPE, pack_color, rasterize_rects
+    from .hit_index import HitIndex
+    from .layout_cache import Layout, LayoutCache
+    from .render_pipelines import render_pipeline
+
+
+# Модули отрисовки тянут numpy, cairo и PIL. Окну индексации они не нужны,
+# поэтому загружаются при первом обращении к имени: {имя: модуль}
+_LAZY_NAMES = {
+    'ColorCache': '.color_cache',
+    'squarify': '.squarify_local',
+    'normalize_sizes': '.squarify_local',
+    'squarify_array': '.squarify_local',
+    'normalize_sizes_array': '.squarify_local',
+    'RECT_DTYPE': '.rasterizer',
+    'pack_color': '.rasterizer',
+    'rasterize_rects': '.rasterizer',
+    'HitIndex': '.hit_index',
+    'Layout': '.layout_cache',
+    'LayoutCache': '.layout_cache',
+    'render_pipeline': '.render_pipelines',
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
 
 
 __all__ = [
     "ColorCache",
     "squarify",
     "normalize_sizes",
+    "squarify_array",
+    "normalize_sizes_array",
+    "RECT_DTYPE",
+    "pack_color",
+    "rasterize_rects",
+    "HitIndex",
+    "RenderScheduler",
+    "Layout",
+    "LayoutCache",
     "format_path",
     "format_bytes",
     "format_date_to_time_ago",
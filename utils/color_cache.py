@@ -1,37 +1,105 @@
-import matplotlib.pyplot as plt
+import numpy as np
 
+import os
 import math
 import logging
 
+from config import DATA_DIR, SETTINGS
+
+
+# Файл с заранее посчитанными таблицами цветов: matplotlib нужен только чтобы его построить
+LUT_PATH = os.path.join(DATA_DIR, 'colormaps.npz')
+# Схема для раскраски по уровню вложенности
+LEVEL_COLOR_MAP = 'tab20'
+
+# Цвет пустых элементов
+EMPTY_COLOR = (50, 50, 50)
+# Размеры до 10^LOG_MIN байт получают первый цвет схемы
+LOG_MIN = 6.0
+
+# Таблицы, уже прочитанные из файла: {имя схемы: массив (steps, 3) uint8}
+_luts: dict[str, np.ndarray] = {}
+
+
+def _build_luts(names: list[str], steps: int) -> dict[str, np.ndarray]:
+    '''
+    Считает таблицы через matplotlib. Для неизвестной схемы таблица пустая
+    '''
+    import matplotlib
+
+    luts: dict[str, np.ndarray] = {}
+    for name in names:
+        try:
+            cmap = matplotlib.colormaps[name]
+        except KeyError:
+            luts[name] = np.zeros((0, 3), dtype=np.uint8)
+            continue
+        if name == LEVEL_COLOR_MAP:
+            rgba = cmap(np.arange(cmap.N))
+        else:
+            rgba = cmap(np.arange(steps) / (steps - 1))
+        # 0-1 -> 0-255
+        luts[name] = (rgba[:, :3] * 255).astype(np.uint8)
+    return luts
+
+
+def _load_luts(cmap_name: str, steps: int) -> dict[str, np.ndarray]:
+    '''
+    Таблицы цветов из файла LUT_PATH. Если нужной схемы там нет, файл строится заново
+    для всех схем из настроек (и их инвертированных вариантов)
+    '''
+    if not _luts and os.path.exists(LUT_PATH):
+        try:
+            with np.load(LUT_PATH) as data:
+                _luts.update({name: data[name] for name in data.files})
+        except (OSError, ValueError) as e:
+            logging.warning(f'Не удалось прочитать таблицы цветов: {e}')
+
+    lut = _luts.get(cmap_name)
+    if lut is not None and len(lut) in (0, steps) and LEVEL_COLOR_MAP in _luts:
+        return _luts
+
+    logging.info('Построение таблиц цветов')
+    names = [name for name in SETTINGS['color_map']['available'] if name not in SETTINGS['color_map']['custom']]
+    names += [name + '_r' for name in names]
+    names += [LEVEL_COLOR_MAP, cmap_name]
+    _luts.update(_build_luts(list(dict.fromkeys(names)), steps))
+    try:
+        temp_path = LUT_PATH + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **_luts) # pyright: ignore[reportArgumentType]
+        os.replace(temp_path, LUT_PATH)
+    except OSError as e:
+        logging.warning(f'Не удалось сохранить таблицы цветов: {e}')
+    return _luts
+
 
 class ColorCache:
     def __init__(self, cmap_name: str, steps: int = 512):
         logging.info(f"Цветовая схема: {cmap_name}")
-        try:
-            self.cmap = plt.get_cmap(cmap_name)
-        except ValueError:
-            self.colors_rgb = [(50, 50, 50)]
+        self.cmap_name = cmap_name
+        luts = _load_luts(cmap_name, steps)
+        self.level_lut = luts[LEVEL_COLOR_MAP]
+        self.level_colors_rgb: list[tuple[int, int, int]] = [tuple(color) for color in self.level_lut.tolist()]
+        # Цвет текста для каждого цвета таблиц считается заранее
+        self.level_text_black = self.text_is_black(self.level_lut)
+        lut = luts[cmap_name]
+        if not len(lut):
+            self.lut = np.array([EMPTY_COLOR], dtype=np.uint8)
+            self.colors_rgb = [EMPTY_COLOR]
+            self.lut_text_black = self.text_is_black(self.lut)
             self.steps = 0
             logging.warning(f"Цветовая схема не найдена: {cmap_name}")
             return
         self.steps = steps
-        self.colors_rgb: list[tuple[int, int, int]] = []
-        self.text_colors_hex: list[str] = [] 
-
-        for i in range(steps):
-            norm = i / (steps - 1)
-            rgba = self.cmap(norm)
-            
-            # 0-1 -> 0-255
-            r = int(rgba[0] * 255)
-            g = int(rgba[1] * 255)
-            b = int(rgba[2] * 255)
-            self.colors_rgb.append((r, g, b))
+        self.lut = lut
+        self.lut_text_black = self.text_is_black(lut)
+        self.colors_rgb: list[tuple[int, int, int]] = [tuple(color) for color in lut.tolist()]
 
     def get_color_rgb_and_text(self, size_bytes: float, global_max_log: float) -> tuple[int, int, int]:
         if size_bytes <= 0:
-            return (50, 50, 50)
-        log_min = 6.0
+            return EMPTY_COLOR
+        log_min = LOG_MIN
         log_curr = math.log10(size_bytes)
         
         if log_curr <= log_min:
@@ -49,14 +117,43 @@ class ColorCache:
         """
         Принимает число и возвращает кортеж (R, G, B) в диапазоне 0-255.
         """
-        cmap = plt.get_cmap('tab20')
-        
-        index = int(number) % cmap.N
-        
-        rgba = cmap(index)
-        
-        r = int(rgba[0] * 255)
-        g = int(rgba[1] * 255)
-        b = int(rgba[2] * 255)
-        
-        return r, g, b
+        return self.level_colors_rgb[int(number) % len(self.level_colors_rgb)]
+
+    @staticmethod
+    def text_is_black(rgb: np.ndarray) -> np.ndarray:
+        '''
+        Для массива цветов (N, 3) — нужен ли на этом фоне чёрный текст (иначе белый)
+        '''
+        rgb = rgb.astype(np.float64)
+        brightness = (rgb[:, 0] * 299 + rgb[:, 1] * 587 + rgb[:, 2] * 114) / 1000
+        return brightness > 128
+
+    def colors_for_sizes(self, sizes: np.ndarray, global_max_log: float) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        То же, что get_color_rgb_and_text, для массива размеров сразу.
+        Возвращает цвета (N, 3) uint8 и признак чёрного текста (N,)
+        '''
+        sizes = np.asarray(sizes, dtype=np.float64)
+        positive = sizes > 0
+        log_curr = np.log10(sizes, out=np.zeros_like(sizes), where=positive)
+        if global_max_log > LOG_MIN:
+            idx = ((log_curr - LOG_MIN) / (global_max_log - LOG_MIN) * (self.steps - 1)).astype(np.int64)
+        else:
+            idx = np.zeros(len(sizes), dtype=np.int64)
+        # Те же ветки, что в get_color_rgb_and_text, в том же порядке
+        idx[log_curr >= global_max_log] = self.steps - 1
+        idx[log_curr <= LOG_MIN] = 0
+        np.clip(idx, 0, max(self.steps - 1, 0), out=idx)
+        rgb = self.lut[idx]
+        rgb[~positive] = EMPTY_COLOR
+        is_black = self.lut_text_black[idx]
+        is_black[~positive] = False
+        return rgb, is_black
+
+    def colors_for_levels(self, levels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        То же, что get_rgb_by_number, для массива уровней сразу.
+        Возвращает цвета (N, 3) uint8 и признак чёрного текста (N,)
+        '''
+        idx = np.asarray(levels, dtype=np.int64) % len(self.level_lut)
+        return self.level_lut[idx], self.level_text_black[idx]
@@ -6,9 +6,9 @@ from utils import format_path
 from config import DATA_DIR
 
 
-def create_database(path: str) -> Database:
+def create_database(path: str, directory: str = DATA_DIR) -> Database:
     name = f'usage_of_{format_path(path)}.db'
-    db = Database(os.path.join(DATA_DIR, name))
+    db = Database(os.path.join(directory, name))
     return db
 
 
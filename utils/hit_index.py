@@ -0,0 +1,67 @@
+import numpy as np
+from typing import Optional
+
+
+# Элемент карты попаданий: (x1, y1, x2, y2, путь, имя, размер, это файл)
+HitItem = tuple[float, float, float, float, str, str, float, bool]
+# Сторона ячейки сетки в пикселях
+CELL_SIZE_PX = 16
+
+
+class HitIndex:
+    '''
+    Равномерная сетка над картой попаданий.
+    В ячейке хранятся номера элементов hit_map, задевающих её, в порядке hit_map,
+    поэтому поиск проверяет только элементы одной ячейки с конца, как и полный перебор:
+    побеждает последний (самый глубокий) элемент, содержащий точку.
+    Номера всех ячеек лежат одним массивом items, ячейка — срез items[starts[c]:starts[c + 1]].
+    '''
+    def __init__(self, hit_map: list[HitItem], width: int, height: int) -> None:
+        self.hit_map = hit_map
+        self.columns = max(1, -(-width // CELL_SIZE_PX))
+        self.rows = max(1, -(-height // CELL_SIZE_PX))
+        cell_count = self.columns * self.rows
+        if not hit_map:
+            self.starts = [0] * (cell_count + 1)
+            self.items: list[int] = []
+            return
+
+        bounds = np.array([item[:4] for item in hit_map], dtype=np.float64)
+        # Границы включаются, как и при проверке попадания
+        left = self._cells(bounds[:, 0], self.columns)
+        top = self._cells(bounds[:, 1], self.rows)
+        right = self._cells(bounds[:, 2], self.columns)
+        bottom = self._cells(bounds[:, 3], self.rows)
+        widths = np.maximum(right - left + 1, 0)
+        counts = widths * np.maximum(bottom - top + 1, 0)
+
+        # Разворачиваем каждый элемент в список задетых им ячеек
+        owner = np.repeat(np.arange(len(hit_map)), counts)
+        local = np.arange(owner.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        row = top[owner] + local // widths[owner]
+        column = left[owner] + local % widths[owner]
+        cells = row * self.columns + column
+        # Стабильная сортировка сохраняет порядок hit_map внутри ячейки
+        order = np.argsort(cells, kind='stable')
+        self.items = owner[order].tolist()
+        self.starts = np.searchsorted(cells[order], np.arange(cell_count + 1)).tolist()
+
+    @staticmethod
+    def _cells(coordinates: np.ndarray, count: int) -> np.ndarray:
+        '''Номера ячеек для координат. Точки за краем относятся к крайним ячейкам'''
+        return np.clip(np.floor(coordinates / CELL_SIZE_PX), 0, count - 1).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.hit_map)
+
+    def find(self, x: float, y: float) -> Optional[HitItem]:
+        '''Самый глубокий элемент, содержащий точку (x, y), или None'''
+        column = min(max(int(x // CELL_SIZE_PX), 0), self.columns - 1)
+        row = min(max(int(y // CELL_SIZE_PX), 0), self.rows - 1)
+        cell = row * self.columns + column
+        hit_map = self.hit_map
+        for i in reversed(self.items[self.starts[cell]:self.starts[cell + 1]]):
+            item = hit_map[i]
+            if item[0] <= x <= item[2] and item[1] <= y <= item[3]:
+                return item
+        return None
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from utils.hit_index import HitItem
+
+
+# Прямоугольник (y1, y2, x1, x2, r, g, b, уровень)
+Rect = tuple[int, int, int, int, int, int, int, int]
+# Подпись (x, y, текст, цвет)
+Text = tuple[float, float, str, str]
+
+# Сколько макетов хранится
+MAX_LAYOUTS = 16
+# Сколько всего прямоугольников и элементов карты попаданий хранится во всех макетах
+MAX_ITEMS = 1_000_000
+# Макет масштабируется под новый размер холста, если пропорции совпадают
+# с точностью ASPECT_TOLERANCE, а размер изменился не больше чем на MAX_SCALE_CHANGE
+ASPECT_TOLERANCE = 0.01
+MAX_SCALE_CHANGE = 0.1
+
+
+class Layout:
+    '''
+    Рассчитанный макет: что рисовать (rects, texts) и карта попаданий.
+    max_depth — глубина, до которой он считался (None — полный макет),
+    is_scaled — получен масштабированием другого макета
+    '''
+    def __init__(
+            self, width: int, height: int,
+            rects: list[Rect], texts: list[Text], hit_map: list[HitItem],
+            max_depth: Optional[int], is_scaled: bool = False
+        ) -> None:
+        self.width = width
+        self.height = height
+        self.rects = rects
+        self.texts = texts
+        self.hit_map = hit_map
+        self.max_depth = max_depth
+        self.is_scaled = is_scaled
+
+    def __len__(self) -> int:
+        return len(self.rects) + len(self.hit_map)
+
+    def scaled(self, width: int, height: int) -> 'Layout':
+        '''
+        Макет для холста другого размера. Подписи не переразмечаются: годится для небольших изменений
+        '''
+        sx, sy = width / self.width, height / self.height
+        return Layout(
+            width, height,
+            [
+                (int(y1 * sy), int(y2 * sy), int(x1 * sx), int(x2 * sx), r, g, b, level)
+                for y1, y2, x1, x2, r, g, b, level in self.rects
+            ],
+            [(x * sx, y * sy, text, color) for x, y, text, color in self.texts],
+            [
+                (x1 * sx, y1 * sy, x2 * sx, y2 * sy, path, name, size, is_file)
+                for x1, y1, x2, y2, path, name, size, is_file in self.hit_map
+            ],
+            self.max_depth,
+            is_scaled=True
+        )
+
+
+class LayoutCache:
+    '''
+    LRU-кэш рассчитанных макетов. Ключ — всё, от чего зависит макет, кроме размера холста
+    (см. LayoutCache.key), плюс глубина и размер. Полный макет подходит и для запроса
+    мелкого прохода, поэтому при возврате к уже открытой папке предпросмотр не нужен.
+    '''
+    def __init__(self, max_layouts: int = MAX_LAYOUTS, max_items: int = MAX_ITEMS) -> None:
+        self.max_layouts = max_layouts
+        self.max_items = max_items
+        self.current_items = 0
+        # {(ключ, глубина, ширина, высота): макет}
+        self._layouts: OrderedDict[tuple[Hashable, Optional[int], int, int], Layout] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+            current_root: str, pipeline: str, color_map: str,
+            global_max_log: float, search_data: set[str], size_field: str = 's'
+        ) -> Hashable:
+        # Множество результатов поиска заменяется его отпечатком
+        search_digest = (len(search_data), hash(frozenset(search_data))) if search_data else None
+        return (current_root, pipeline, color_map, global_max_log, search_digest, size_field)
+
+    def get(self, key: Hashable, width: int, height: int, max_depth: Optional[int]) -> Optional[Layout]:
+        '''
+        Макет для холста width x height не мельче max_depth: сохранённый или отмасштабированный
+        из сохранённого для близкого размера с теми же пропорциями. None, если такого нет
+        '''
+        depths = (None,) if max_depth is None else (None, max_depth)
+        with self._lock:
+            for depth in depths:
+                layout = self._layouts.get((key, depth, width, height))
+                if layout is not None:
+                    self._layouts.move_to_end((key, depth, width, height))
+                    return layout
+            source = None
+            # Масштабируются только рассчитанные макеты, чтобы ошибки округления не накапливались
+            for (layout_key, depth, _, _), layout in reversed(self._layouts.items()):
+                if (layout_key == key and depth in depths and not layout.is_scaled
+                        and self._can_scale(layout, width, height)):
+                    source = layout
+                    break
+        if source is None:
+            return None
+        layout = source.scaled(width, height)
+        self.put(key, layout)
+        return layout
+
+    @staticmethod
+    def _can_scale(layout: Layout, width: int, height: int) -> bool:
+        aspect, new_aspect = layout.width / max(layout.height, 1), width / max(height, 1)
+        return (
+            abs(new_aspect / aspect - 1) <= ASPECT_TOLERANCE
+            and abs(width / layout.width - 1) <= MAX_SCALE_CHANGE
+        )
+
+    def put(self, key: Hashable, layout: Layout) -> None:
+        if len(layout) > self.max_items:
+            return
+        cache_key = (key, layout.max_depth, layout.width, layout.height)
+        with self._lock:
+            previous = self._layouts.pop(cache_key, None)
+            if previous is not None:
+                self.current_items -= len(previous)
+            self._layouts[cache_key] = layout
+            self.current_items += len(layout)
+            while len(self._layouts) > self.max_layouts or self.current_items > self.max_items:
+                _, evicted = self._layouts.popitem(last=False)
+                self.current_items -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._layouts.clear()
+            self.current_items = 0
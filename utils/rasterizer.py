@@ -0,0 +1,106 @@
+import numpy as np
+
+
+# Прямоугольник макета: границы в пикселях, цвет и глубина вложенности
+RECT_DTYPE = np.dtype([
+    ('y1', np.int32), ('y2', np.int32), ('x1', np.int32), ('x2', np.int32),
+    ('r', np.uint8), ('g', np.uint8), ('b', np.uint8),
+    ('level', np.int32)
+])
+# Прямоугольники не больше этой площади заливаются одним векторным присваиванием на уровень,
+# большие — срезами по одному
+SMALL_RECT_AREA = 1024
+# Сколько пикселей маленьких прямоугольников обрабатывается за раз (ограничивает память)
+PIXELS_PER_CHUNK = 1 << 20
+
+
+def pack_color(r: int, g: int, b: int) -> int:
+    '''Пиксель с байтами r, g, b, 255 (так буфер читается как RGBA) в виде uint32'''
+    return int(np.array([r, g, b, 255], dtype=np.uint8).view(np.uint32)[0])
+
+
+def rasterize_rects(data: bytearray, width: int, height: int, rects: np.ndarray, background: int) -> None:
+    '''
+    Заливает прямоугольники (массив RECT_DTYPE) прямо в буфер data (width * height пикселей по 4 байта):
+    сначала фон, затем каждый прямоугольник — чёрная рамка в 1 пиксель и цветная середина.
+    Прямоугольники шире и выше 2 пикселей получают рамку, остальные заливаются цветом целиком.
+
+    Прямоугольники одного уровня не пересекаются, а ребёнок всегда лежит внутри родителя,
+    поэтому рисовать по уровням — то же самое, что рисовать по порядку списка,
+    а внутри уровня все маленькие прямоугольники можно залить одним присваиванием.
+    '''
+    pixels = np.frombuffer(data, dtype=np.uint32, count=width * height).reshape(height, width)
+    pixels[:] = background
+    if not len(rects):
+        return
+    black = pack_color(0, 0, 0)
+
+    rects = rects[np.argsort(rects['level'], kind='stable')]
+    y1 = rects['y1'].astype(np.int64)
+    y2 = rects['y2'].astype(np.int64)
+    x1 = rects['x1'].astype(np.int64)
+    x2 = rects['x2'].astype(np.int64)
+    colors = np.stack(
+        [rects['r'], rects['g'], rects['b'], np.full(len(rects), 255, dtype=np.uint8)], axis=1
+    ).view(np.uint32)[:, 0]
+    framed = (x2 - x1 > 2) & (y2 - y1 > 2)
+    # Видимая часть прямоугольника
+    cy1, cy2 = np.clip(y1, 0, height), np.clip(y2, 0, height)
+    cx1, cx2 = np.clip(x1, 0, width), np.clip(x2, 0, width)
+    area = np.maximum(cy2 - cy1, 0) * np.maximum(cx2 - cx1, 0)
+    # Маленькими считаются только прямоугольники, видимые целиком: у обрезанных рамка не по краю видимой части
+    small_mask = (area > 0) & (area <= SMALL_RECT_AREA) & (x1 >= 0) & (y1 >= 0) & (x2 <= width) & (y2 <= height)
+
+    levels = rects['level']
+    bounds = np.flatnonzero(np.diff(levels)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(rects)]))
+    flat = pixels.reshape(-1)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        indices = np.arange(start, end)
+        small = indices[small_mask[start:end]]
+        large = indices[~small_mask[start:end] & (area[start:end] > 0)]
+
+        for top, bottom, left, right, is_framed, color in zip(
+                y1[large].tolist(), y2[large].tolist(), x1[large].tolist(), x2[large].tolist(),
+                framed[large].tolist(), colors[large].tolist()):
+            visible = pixels[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+            if is_framed:
+                visible[:] = black
+                pixels[max(top + 1, 0):max(bottom - 1, 0), max(left + 1, 0):max(right - 1, 0)] = color
+            else:
+                visible[:] = color
+
+        # Маленькие прямоугольники разворачиваются в список пикселей порциями
+        chunk_ends = np.cumsum(area[small]) // PIXELS_PER_CHUNK
+        for chunk in np.split(small, np.flatnonzero(np.diff(chunk_ends)) + 1):
+            if chunk.size:
+                _fill_small(flat, width, chunk, y1, y2, cy1, cy2, cx1, cx2, colors, framed, black)
+
+
+def _fill_small(
+        flat: np.ndarray, width: int, chunk: np.ndarray,
+        y1: np.ndarray, y2: np.ndarray, cy1: np.ndarray, cy2: np.ndarray, cx1: np.ndarray, cx2: np.ndarray,
+        colors: np.ndarray, framed: np.ndarray, black: int
+    ) -> None:
+    '''
+    Заливает непересекающиеся прямоугольники chunk одним присваиванием по индексам пикселей:
+    прямоугольники разворачиваются в строки, строки — в пиксели
+    '''
+    heights = cy2[chunk] - cy1[chunk]
+    row_owner = np.repeat(chunk, heights)
+    row_y = cy1[row_owner] + np.arange(row_owner.size) - np.repeat(np.cumsum(heights) - heights, heights)
+    row_width = cx2[row_owner] - cx1[row_owner]
+    row_color = colors[row_owner]
+    # Верхняя и нижняя строки рамки целиком чёрные
+    row_framed = framed[row_owner]
+    row_color[row_framed & ((row_y == y1[row_owner]) | (row_y == y2[row_owner] - 1))] = black
+
+    row_end = np.cumsum(row_width)
+    row_start = row_end - row_width
+    pixel = np.repeat(row_y * width + cx1[row_owner] - row_start, row_width) + np.arange(row_end[-1])
+    values = np.repeat(row_color, row_width)
+    # Левый и правый столбцы рамки
+    values[row_start[row_framed]] = black
+    values[row_end[row_framed] - 1] = black
+    flat[pixel] = values
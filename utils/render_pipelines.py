@@ -1,38 +1,52 @@
 import cairo
+import numpy as np
 from PIL import Image
 
 import time
-import pickle
 import logging
-import threading
-import compression.zstd
-from typing import Any
+from typing import Callable, Optional
 
 import utils.squarify_local as squarify
-from logic import Database
+from logic import RecordCache
 from utils import ColorCache
+from utils.layout_cache import Layout, LayoutCache
+from utils.rasterizer import RECT_DTYPE, pack_color, rasterize_rects
 
 
 CULLING_SIZE_PX = 2
 
 
+class RenderCancelled(Exception):
+    '''Отрисовка отменена: результат уже не нужен'''
+
+
 def render_pipeline(
         pipeline: str,
         width: int, height: int,
         current_root: str,
-        database: Database,
+        records: RecordCache,
         color_cache: ColorCache,
         global_max_log: float,
         search_data: set[str],
         is_level_color_map: bool,
-        data_lock: threading.Lock
-    ) -> tuple[Image.Image, list[tuple[float, float, float, float, str, str, float, bool]]]:
+        max_depth: Optional[int] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        layout_cache: Optional[LayoutCache] = None
+    ) -> Optional[tuple[Image.Image, list[tuple[float, float, float, float, str, str, float, bool]], bool]]:
     '''
     Пайплайн отрисовки в виде TreeMap.
+    max_depth: глубже этого уровня папки рисуются без содержимого (None — без ограничения).
+    is_cancelled: проверяется во время расчёта макета; если вернула True, результат — None.
+    layout_cache: кэш макетов, из которого берётся и куда кладётся макет.
+    Возвращает (изображение, карта попаданий, макет полный — не ограничен max_depth).
     '''
+    def _check_cancelled() -> None:
+        if is_cancelled is not None and is_cancelled():
+            raise RenderCancelled()
+
     def _calculate_tree_map_layout(
-            rects: list[tuple[int, int, int, int, int, int, int]],
-            texts: list[tuple[float, float, str, str]],
+            rects: list[tuple[int, int, int, int, int, float, int, bool]],
+            texts: list[tuple[float, float, str, int]],
             hit_map: list[tuple[float, float, float, float, str, str, float, bool]],
             path_str: str,
             size: float, x: float, y: float, dx: float, dy: float,
@@ -44,20 +58,13 @@ def render_pipeline(
         stack = [(path_str, path_str, size, x, y, dx, dy, level)]
         while stack:
             path, name, size, x, y, dx, dy, level = stack.pop()
+            _check_cancelled()
 
             if dx < CULLING_SIZE_PX or dy < CULLING_SIZE_PX:
                 continue
 
-            if is_level_color_map:
-                rgb_color = color_cache.get_rgb_by_number(level)
-            else:
-                rgb_color = color_cache.get_color_rgb_and_text(size, global_max_log)
-            r, g, b = rgb_color
-            brightness = (r * 299 + g * 587 + b * 114) / 1000
-            text_color = "black" if brightness > 128 else "white"
-            
             ix, iy, idx, idy = int(x), int(y), int(dx), int(dy)
-            rects.append((iy, iy+idy, ix, ix+idx, r, g, b)) 
+            rects.append((iy, iy+idy, ix, ix+idx, level, size, level, False))
             
             hit_map.append((x, y, x+dx, y+dy, path, name, size, False))
 
@@ -68,83 +75,71 @@ def render_pipeline(
                 header_h = 20
                 max_chars = int(dx / 10)
                 disp_name = name if len(name) <= max_chars else name[:max_chars] + "..."
-                texts.append((x+4, y+3, disp_name, text_color))
+                texts.append((x+4, y+3, disp_name, len(rects) - 1))
+
+            if max_depth is not None and level >= max_depth:
+                continue
 
             pad = 2
             norm_w, norm_h = dx - 2*pad, dy - header_h - 2*pad
             if norm_w < 4 or norm_h < 4:
                 continue
             
-            with data_lock:
-                data = database[path]
-
-            subfolders = pickle.loads(compression.zstd.decompress(data['subfolders']))
+            subfolders = records.subfolders(path)
             if search_data:
                 subfolders = [x for x in subfolders if x['p'] in search_data]
 
+            show_files = not (level > 0 and not search_data)
             files = []
-            if level > 0 and not search_data:
-                sizes: list[float] = [x['s'] for x in subfolders]
-            else:
-                files = pickle.loads(compression.zstd.decompress(data['files']))
+            if show_files:
+                files = records.files(path)
                 if search_data:
                     files = [x for x in files if x['p'] in search_data]
-                sizes: list[float] = [x['s'] for x in subfolders + files]
-                sizes.sort(reverse=True)
-
-            norm = squarify.normalize_sizes(sizes, norm_w, norm_h, sum(sizes)) # pyright: ignore[reportUnknownMemberType]
-            subfolders_norm, files_norm = norm[:len(subfolders)], norm[len(subfolders):]
-            while 0.0 in subfolders_norm:
-                subfolders_norm.remove(0.0)
-            while 0.0 in files_norm:
-                files_norm.remove(0.0)
-            subfolders_len = len(subfolders_norm)
-            rects_sq: list[dict[str, Any]] = squarify.squarify(subfolders_norm+files_norm, x + pad, y + header_h + pad, norm_w, norm_h) # type: ignore
-            subfolders_rects, files_rects = rects_sq[:subfolders_len], rects_sq[subfolders_len:]
-
-            for rect, folder in zip(subfolders_rects, subfolders):
-                rx, ry, rdx, rdy = rect['x'], rect['y'], rect['dx'], rect['dy']
-
-                stack.append((
-                    folder['p'], 
-                    folder['n'],
-                    folder['s'], 
-                    rx, ry, rdx, rdy, 
-                    level + 1
-                ))
-
-            if level > 0 and not search_data:
+            items = subfolders + files
+            if not items:
                 continue
-            
-            for rect, file in zip(files_rects, files):
-                rx, ry, rdx, rdy = rect['x'], rect['y'], rect['dx'], rect['dy']
-                
+
+            # Папки и файлы раскладываются вместе, по убыванию размера.
+            # order — номер элемента в items для каждого прямоугольника
+            sizes = np.fromiter((item['s'] for item in items), dtype=np.float64, count=len(items))
+            order = np.argsort(-sizes, kind='stable')
+            order = order[sizes[order] > 0]
+            norm = squarify.normalize_sizes_array(sizes[order], norm_w, norm_h)
+            rects_sq = squarify.squarify_array(norm, x + pad, y + header_h + pad, norm_w, norm_h)
+
+            subfolders_len = len(subfolders)
+            for (rx, ry, rdx, rdy), index in zip(rects_sq.tolist(), order.tolist()):
+                item = items[index]
+                if index < subfolders_len:
+                    stack.append((
+                        item['p'],
+                        item['n'],
+                        item['s'],
+                        rx, ry, rdx, rdy,
+                        level + 1
+                    ))
+                    continue
+
                 if rdx > CULLING_SIZE_PX and rdy > CULLING_SIZE_PX:
-                    if is_level_color_map:
-                        f_rgb = color_cache.get_rgb_by_number(level)
-                    else:
-                        f_rgb = color_cache.get_color_rgb_and_text(file['s'], global_max_log)
-                    r, g, b = f_rgb
-                    brightness = (r * 299 + g * 587 + b * 114) / 1000
-                    text_color = "black" if brightness > 128 else "white"
                     rix, riy, ridx, ridy = int(rx), int(ry), int(rdx), int(rdy)
-                    
-                    rects.append((riy, riy+ridy, rix, rix+ridx, r, g, b))
-                    
+
+                    # Файл окрашивается по уровню своей папки
+                    rects.append((riy, riy+ridy, rix, rix+ridx, level + 1, item['s'], level, False))
+
+                    name = item['n']
                     if rdx > 40 and rdy > 30:
                         max_chars = int(rdx / 10)
-                        name = file['n']
                         dname = name if len(name) <= max_chars else name[:max_chars] + "..."
 
-                        texts.append((rx+4, ry+3, dname, text_color))
-                    
-                    hit_map.append((rx, ry, rx+rdx, ry+rdy, file['p'], name, file['s'], True))
+                        texts.append((rx+4, ry+3, dname, len(rects) - 1))
+
+                    hit_map.append((rx, ry, rx+rdx, ry+rdy, item['p'], name, item['s'], True))
         end_time = time.perf_counter()
         return end_time - start_time
 
     def _calculate_columns_layout(
-            rects: list[tuple[int, int, int, int, int, int, int]],
-            texts: list[tuple[float, float, str, str]],
+            rects: list[tuple[int, int, int, int, int, float, int, bool]],
+            texts: list[tuple[float, float, str, int]],
             hit_map: list[tuple[float, float, float, float, str, str, float, bool]],
             path_str: str,
             size: float, x: float, y: float, dx: float, dy: float,
@@ -159,41 +154,35 @@ def render_pipeline(
 
         while stack:
             curr_path, curr_name, curr_size, cx, cy, cdx, cdy, lvl = stack.pop()
+            _check_cancelled()
 
             if cdx < CULLING_SIZE_PX or cdy < CULLING_SIZE_PX:
                 continue
-            
-            if is_level_color_map:
-                rgb_color = color_cache.get_rgb_by_number(lvl)
-            else:
-                rgb_color = color_cache.get_color_rgb_and_text(curr_size, global_max_log)
-            r, g, b = rgb_color
-            brightness = (r * 299 + g * 587 + b * 114) / 1000
-            text_color = "black" if brightness > 128 else "white"
 
-            rects.append((int(cy), int(cy + cdy), int(cx), int(cx + cdx), r, g, b))
+            rects.append((int(cy), int(cy + cdy), int(cx), int(cx + cdx), lvl, curr_size, lvl, False))
 
             header_h = 0.0
             if cdx > 40 and cdy > 40:
                 header_h = 20.0
                 max_chars = int(cdx / 9)
                 disp_name = curr_name[:max_chars] + "..." if len(curr_name) > max_chars else curr_name
-                texts.append((cx + 4, cy + 3, disp_name, text_color))
+                texts.append((cx + 4, cy + 3, disp_name, len(rects) - 1))
 
-            with data_lock:
-                if curr_path not in database:
-                    hit_map.append((cx, cy, cx+cdx, cy+cdy, curr_path, curr_name, curr_size, True))
-                    continue
-                
-                node_data = database[curr_path]
-                hit_map.append((cx, cy, cx+cdx, cy+cdy, curr_path, curr_name, curr_size, False))
+            if curr_path not in records:
+                hit_map.append((cx, cy, cx+cdx, cy+cdy, curr_path, curr_name, curr_size, True))
+                continue
+
+            hit_map.append((cx, cy, cx+cdx, cy+cdy, curr_path, curr_name, curr_size, False))
+
+            if max_depth is not None and lvl >= max_depth:
+                continue
 
             child_area_h = cdy - header_h
             if child_area_h < 2.0:
                 continue
 
-            subfolders = pickle.loads(compression.zstd.decompress(node_data['subfolders']))
-            files = pickle.loads(compression.zstd.decompress(node_data['files']))
+            subfolders = records.subfolders(curr_path)
+            files = records.files(curr_path)
 
             if search_data:
                 subfolders = [x for x in subfolders if x['p'] in search_data]
@@ -202,8 +191,9 @@ def render_pipeline(
             if not subfolders and not files:
                 continue
 
-            subfolders.sort(key=lambda x: x['s'], reverse=True) # pyright: ignore[reportUnknownLambdaType]
-            files.sort(key=lambda x: x['s'], reverse=True) # pyright: ignore[reportUnknownLambdaType]
+            # Списки из кэша общие, поэтому сортируем копии
+            subfolders = sorted(subfolders, key=lambda x: x['s'], reverse=True) # pyright: ignore[reportUnknownLambdaType]
+            files = sorted(files, key=lambda x: x['s'], reverse=True) # pyright: ignore[reportUnknownLambdaType]
 
             sum_folders = sum(f['s'] for f in subfolders)
             sum_files = sum(f['s'] for f in files)
@@ -244,8 +234,6 @@ def render_pipeline(
             
             file_draw_x = current_x + extra_file_pad
             file_draw_w = raw_files_width - (2 * extra_file_pad)
-            
-            dark_factor = 0.75 
 
             if file_draw_w >= CULLING_SIZE_PX:
                 file_y_cursor = start_y
@@ -255,18 +243,12 @@ def render_pipeline(
                     file_h = file_h_ratio * available_h
                     
                     if file_h >= 1.0:
-                        if is_level_color_map:
-                            f_rgb = color_cache.get_rgb_by_number(lvl)
-                        else:
-                            f_rgb = color_cache.get_color_rgb_and_text(file['s'], global_max_log)
-                        fr = f_rgb[0] * dark_factor
-                        fg = f_rgb[1] * dark_factor
-                        fb = f_rgb[2] * dark_factor
-                        
+                        # Файлы темнее папок
                         rects.append((
                             int(file_y_cursor), int(file_y_cursor + file_h),
                             int(file_draw_x), int(file_draw_x + file_draw_w),
-                            int(fr), int(fg), int(fb)
+                            lvl + 1,
+                            file['s'], lvl, True
                         ))
                         
                         hit_map.append((
@@ -277,42 +259,65 @@ def render_pipeline(
                         ))
                         
                         if file_h > 14 and file_draw_w > 40:
-                            f_bright = (fr * 299 + fg * 587 + fb * 114) / 1000
-                            f_tcol = "black" if f_bright > 128 else "white"
-                            
                             max_f_chars = int(file_draw_w / 9)
                             f_disp_name = file['n']
                             if len(f_disp_name) > max_f_chars:
                                 f_disp_name = f_disp_name[:max_f_chars] + "..."
                             
-                            texts.append((file_draw_x + 4, file_y_cursor + (file_h/2) - 7, f_disp_name, f_tcol))
+                            texts.append((file_draw_x + 4, file_y_cursor + (file_h/2) - 7, f_disp_name, len(rects) - 1))
                     
                     file_y_cursor += file_h
         end_time = time.perf_counter()
         return end_time - start_time
 
-    # Список (y1, y2, x1, x2, r, g, b)
-    rects: list[tuple[int, int, int, int, int, int, int]] = []
-    # Список (x, y, text, font, color, anchor)
-    texts: list[tuple[float, float, str, str]] = []
-    # Список (x1, y1, x2, y2, name, size_str, size, is_file, is_group)
-    hit_map: list[tuple[float, float, float, float, str, str, float, bool]] = []
-    logging.info(f'Начало расчета макета {pipeline}...')
-    with data_lock:
-        size = database[current_root]['s']
-    layout = _calculate_tree_map_layout
-    if pipeline == 'Columns':
-        layout = _calculate_columns_layout
-    execution_time = layout(
-        rects, texts, hit_map,
-        current_root,
-        size, 0, 0, width, height, 0
-    )
-    logging.info(f'Расчёт макета завершён. Получено {len(rects)=} | {len(texts)=} | {len(hit_map)=}')
-    logging.info(f'Время расчёта макета: {execution_time} секунд')
-    
+    layout_key = None
+    layout = None
+    if layout_cache is not None:
+        layout_key = LayoutCache.key(current_root, pipeline, color_cache.cmap_name, global_max_log, search_data, records.size_field)
+        layout = layout_cache.get(layout_key, width, height, max_depth)
+        if layout is not None:
+            logging.info(f'Макет взят из кэша ({layout.is_scaled=})')
+
+    if layout is None:
+        # Список (y1, y2, x1, x2, уровень, размер для цвета, уровень для цвета, затемнить)
+        shapes: list[tuple[int, int, int, int, int, float, int, bool]] = []
+        # Список (x, y, text, номер прямоугольника под текстом)
+        labels: list[tuple[float, float, str, int]] = []
+        # Список (x1, y1, x2, y2, name, size_str, size, is_file, is_group)
+        hit_map: list[tuple[float, float, float, float, str, str, float, bool]] = []
+        logging.info(f'Начало расчета макета {pipeline}...')
+        size = records.size(current_root)
+        calculate = _calculate_tree_map_layout
+        if pipeline == 'Columns':
+            calculate = _calculate_columns_layout
+        try:
+            execution_time = calculate(
+                shapes, labels, hit_map,
+                current_root,
+                size, 0, 0, width, height, 0
+            )
+        except RenderCancelled:
+            logging.info('Расчёт макета отменён')
+            return None
+        start_time = time.perf_counter()
+        rects, texts = _paint(shapes, labels, color_cache, global_max_log, is_level_color_map)
+        logging.info(f'Расчёт макета завершён. Получено {len(rects)=} | {len(texts)=} | {len(hit_map)=}')
+        logging.info(f'Время расчёта макета: {execution_time} секунд, цветов: {time.perf_counter() - start_time} секунд')
+        logging.info(f'Кэш записей: {records.stats()}')
+        layout = Layout(width, height, rects, texts, hit_map, max_depth)
+        if layout_cache is not None:
+            layout_cache.put(layout_key, layout)
+    if is_cancelled is not None and is_cancelled():
+        return None
+
     stride = width * 4
     data = bytearray(stride * height)
+    start_time = time.perf_counter()
+    bg_val = 32
+    rasterize_rects(data, width, height, np.array(layout.rects, dtype=RECT_DTYPE), pack_color(bg_val, bg_val, bg_val))
+    logging.info(f'Время заливки прямоугольников: {time.perf_counter() - start_time} секунд')
+
+    # Cairo рисует только текст поверх уже залитого буфера
     surface = cairo.ImageSurface.create_for_data(
         data, 
         cairo.FORMAT_ARGB32, 
@@ -320,38 +325,13 @@ def render_pipeline(
         height, 
         stride
     )
+    surface.mark_dirty()
     ctx = cairo.Context(surface)
 
-    bg_val = 32 / 255.0
-    ctx.set_source_rgb(bg_val, bg_val, bg_val)
-    ctx.paint() #
-    for y1, y2, x1, x2, r, g, b in rects:
-        w = x2 - x1
-        h = y2 - y1
-        
-        # --- Черная подложка (Outline) ---
-        ctx.set_source_rgb(0, 0, 0)
-        ctx.rectangle(x1, y1, w, h)
-        ctx.fill()
-        
-        # --- Цветная середина ---
-        if w > 2 and h > 2:
-            # Cairo принимает цвета 0.0-1.0
-            # Cairo ARGB пишет в памяти B-G-R-A (на little-endian).
-            ctx.set_source_rgb(b/255.0, g/255.0, r/255.0)
-            
-            # Рисуем внутренний квадрат (+1 пиксель отступа)
-            ctx.rectangle(x1 + 1, y1 + 1, w - 2, h - 2)
-            ctx.fill()
-        else:
-            ctx.set_source_rgb(b/255.0, g/255.0, r/255.0)
-            ctx.rectangle(x1, y1, w, h)
-            ctx.fill()
-
     ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
     ctx.set_font_size(14) 
 
-    for tx, ty, ttext, tcol in texts:
+    for tx, ty, ttext, tcol in layout.texts:
         if tcol == 'black':
             ctx.set_source_rgb(0, 0, 0)
         else:
@@ -361,4 +341,40 @@ def render_pipeline(
     surface.flush()
 
     image = Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1)
-    return (image, hit_map)
+    return (image, layout.hit_map, layout.max_depth is None)
+
+
+# Доля яркости файлов в режиме Columns
+FILE_DARK_FACTOR = 0.75
+
+
+def _paint(
+        shapes: list[tuple[int, int, int, int, int, float, int, bool]],
+        labels: list[tuple[float, float, str, int]],
+        color_cache: ColorCache,
+        global_max_log: float,
+        is_level_color_map: bool
+    ) -> tuple[list[tuple[int, int, int, int, int, int, int, int]], list[tuple[float, float, str, str]]]:
+    '''
+    Раскрашивает весь макет одним вызовом таблицы цветов вместо вызова на каждый прямоугольник.
+    Возвращает прямоугольники (y1, y2, x1, x2, r, g, b, уровень) и подписи (x, y, text, color)
+    '''
+    if not shapes:
+        return [], []
+    y1, y2, x1, x2, levels, color_sizes, color_levels, dark = zip(*shapes)
+    if is_level_color_map:
+        rgb, is_black = color_cache.colors_for_levels(np.array(color_levels, dtype=np.int64))
+    else:
+        rgb, is_black = color_cache.colors_for_sizes(np.array(color_sizes, dtype=np.float64), global_max_log)
+
+    dark_mask = np.array(dark, dtype=bool)
+    if dark_mask.any():
+        dark_rgb = rgb[dark_mask] * FILE_DARK_FACTOR
+        # Цвет текста считается по ещё не округлённому цвету
+        is_black[dark_mask] = color_cache.text_is_black(dark_rgb)
+        rgb[dark_mask] = dark_rgb.astype(np.uint8)
+
+    rects = list(zip(y1, y2, x1, x2, rgb[:, 0].tolist(), rgb[:, 1].tolist(), rgb[:, 2].tolist(), levels))
+    text_black = is_black.tolist()
+    texts = [(x, y, text, 'black' if text_black[i] else 'white') for x, y, text, i in labels]
+    return rects, texts
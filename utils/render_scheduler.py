@@ -0,0 +1,60 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+
+# Глубина быстрого первого прохода отрисовки
+PREVIEW_DEPTH = 2
+
+# Задача отрисовки: (максимальная глубина или None, проверка отмены) -> результат окончательный
+RenderJob = Callable[[Optional[int], Callable[[], bool]], bool]
+
+
+class RenderScheduler:
+    '''
+    Один поток отрисовки. Каждая новая задача увеличивает номер поколения,
+    и все задачи старших поколений считаются отменёнными: проверка отмены вызывается
+    внутри расчёта макета, поэтому устаревшая отрисовка обрывается, а не доделывается.
+    Задача выполняется проходами: сначала мелкий (до PREVIEW_DEPTH уровней), затем полный.
+    Если задача вернула True (например, полный макет нашёлся в кэше), остальные проходы пропускаются.
+    '''
+    def __init__(self, passes: tuple[Optional[int], ...] = (PREVIEW_DEPTH, None)) -> None:
+        self.passes = passes
+        self.generation = 0
+        self._job: Optional[RenderJob] = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def submit(self, job: RenderJob) -> None:
+        '''Ставит задачу, отменяя текущую и ещё не начатую'''
+        with self._condition:
+            self.generation += 1
+            self._job = job
+            self._condition.notify()
+
+    def cancel(self) -> None:
+        with self._condition:
+            self.generation += 1
+            self._job = None
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                while self._job is None:
+                    self._condition.wait()
+                job, generation = self._job, self.generation
+                self._job = None
+
+            def is_cancelled() -> bool:
+                return self.generation != generation
+
+            for max_depth in self.passes:
+                if is_cancelled():
+                    break
+                try:
+                    if job(max_depth, is_cancelled):
+                        break
+                except Exception:
+                    logging.exception('Ошибка отрисовки')
+                    break
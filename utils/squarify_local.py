@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def normalize_sizes(sizes: list[float], dx: float, dy: float, total_size: float) -> list[float]:
     """
     Нормализует список числовых значений так, чтобы `sum(sizes) == dx * dy`.
@@ -97,4 +100,105 @@ def squarify(sizes: list[float], x: float, y: float, dx: float, dy: float) -> li
     if row_vals:
         layout_row(row_vals, row_sum, curr_x, curr_y, curr_dx, curr_dy)
 
-    return rects
\ No newline at end of file
+    return rects
+
+def normalize_sizes_array(sizes: np.ndarray, dx: float, dy: float) -> np.ndarray:
+    """
+    То же, что normalize_sizes, но для массива NumPy.
+    """
+    total_size = sizes.sum()
+    if total_size == 0: return np.zeros_like(sizes, dtype=np.float64)
+    return sizes * (dx * dy / total_size)
+
+
+# Сколько кандидатов в ряд проверяется за раз как минимум (окно растёт, если ряд длиннее)
+ROW_WINDOW = 32
+# До стольких элементов обычный squarify быстрее: накладные расходы NumPy больше самой работы
+SMALL_COUNT = 48
+
+
+def squarify_array(sizes: np.ndarray, x: float, y: float, dx: float, dy: float) -> np.ndarray:
+    """
+    Разбивает массив числовых значений на квадраты, как squarify.
+    sizes обязан быть отсортирован по убыванию и не содержать нулей, sum(sizes) == dx * dy.
+    Возвращает массив (N, 4) со столбцами x, y, dx, dy.
+
+    Худшее соотношение сторон для всех вариантов длины ряда считается сразу по
+    накопленным суммам, ряд заканчивается перед первым ухудшением.
+    В цикле определяются только границы рядов, координаты считаются в конце одним проходом.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    count = len(sizes)
+    if count <= SMALL_COUNT:
+        small = squarify(sizes.tolist(), x, y, dx, dy)
+        return np.array([(r['x'], r['y'], r['dx'], r['dy']) for r in small], dtype=np.float64).reshape(count, 4)
+    rects = np.empty((count, 4), dtype=np.float64)
+    cumulative = np.concatenate(([0.0], np.cumsum(sizes)))
+
+    # Параметры рядов: конец, x, y, толщина, горизонтальный ли ряд
+    row_ends: list[int] = []
+    row_x: list[float] = []
+    row_y: list[float] = []
+    row_thickness: list[float] = []
+    row_horizontal: list[bool] = []
+    start = 0
+    window = ROW_WINDOW
+    while start < count:
+        w = min(dx, dy)
+        # Если места не осталось, остаток уходит в один ряд нулевой толщины
+        end = _row_end(sizes, cumulative, start, w, window) if w > 0 else count
+        # Размеры убывают, поэтому следующий ряд обычно не короче предыдущего
+        window = max(ROW_WINDOW, 2 * (end - start))
+        is_horizontal = dx >= dy
+        side = dy if is_horizontal else dx
+        thickness = (cumulative[end] - cumulative[start]) / side if side > 0 else 0.0
+        row_ends.append(end)
+        row_x.append(x)
+        row_y.append(y)
+        row_thickness.append(thickness)
+        row_horizontal.append(is_horizontal)
+        if is_horizontal:
+            x, dx = x + thickness, dx - thickness
+        else:
+            y, dy = y + thickness, dy - thickness
+        start = end
+
+    ends = np.array(row_ends)
+    row_of = np.repeat(np.arange(len(ends)), np.diff(ends, prepend=0))
+    thickness = np.array(row_thickness)[row_of]
+    horizontal = np.array(row_horizontal)[row_of]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lengths = np.where(thickness > 0, sizes / thickness, 0.0)
+    # Начало каждого прямоугольника в ряду: сумма длин предыдущих прямоугольников того же ряда
+    passed = np.cumsum(lengths) - lengths
+    offsets = passed - np.concatenate(([0.0], passed[ends[:-1]]))[row_of]
+
+    base_x = np.array(row_x)[row_of]
+    base_y = np.array(row_y)[row_of]
+    rects[:, 0] = np.where(horizontal, base_x, base_x + offsets)
+    rects[:, 1] = np.where(horizontal, base_y + offsets, base_y)
+    rects[:, 2] = np.where(horizontal, thickness, lengths)
+    rects[:, 3] = np.where(horizontal, lengths, thickness)
+    return rects
+
+
+def _row_end(sizes: np.ndarray, cumulative: np.ndarray, start: int, w: float, window: int) -> int:
+    """
+    Конец ряда, начинающегося со start: элементы добавляются, пока худшее
+    соотношение сторон не начинает расти (то же правило, что в squarify).
+    """
+    count = len(sizes)
+    w2 = w * w
+    while True:
+        stop = min(count, start + window)
+        # Ряды [start, end) для всех end из start+1..stop
+        row_sums = cumulative[start + 1:stop + 1] - cumulative[start]
+        s2 = row_sums * row_sums
+        worst = np.maximum((w2 * sizes[start]) / s2, s2 / (w2 * sizes[start:stop]))
+        rises = worst[1:] > worst[:-1]
+        first = int(rises.argmax()) if rises.size else 0
+        if rises.size and rises[first]:
+            return start + 1 + first
+        if stop == count:
+            return count
+        window *= 4